@@ -0,0 +1,106 @@
+"""
+Agregados pré-calculados sobre a tabela fato.
+"""
+import numpy as np
+import pandas as pd
+
+CITY_MONTH_KEY = ['Mês', 'Estado', 'Cidade']
+CITY_TOTAL_COLUMNS = ['Faturamento Total da Cidade no Mês', 'Total de Pedidos da Cidade no Mês']
+DIVERGENT_COLUMN = 'Totais Divergentes'
+
+
+def build_city_month_totals(df):
+    """
+    Tabela cidade-mês deduplicada, indexada por (Mês, Estado, Cidade).
+
+    Mantém os totais da primeira linha de cada cidade-mês, como o antigo
+    `drop_duplicates`, mas marca em 'Totais Divergentes' as cidades-mês cujas
+    linhas de produto discordam entre si.
+    """
+    grouped = df.groupby(CITY_MONTH_KEY, observed=True, sort=True)[CITY_TOTAL_COLUMNS]
+    table = grouped.first()
+    table[DIVERGENT_COLUMN] = (grouped.min() != grouped.max()).any(axis=1)
+    return table
+
+
+def update_city_month_totals(city_month, df, keys):
+    """
+    Tabela cidade-mês com apenas as cidades-mês `keys` (MultiIndex de
+    (Mês, Estado, Cidade)) recalculadas a partir de `df`.
+    """
+    kept = city_month[~city_month.index.isin(keys)]
+    # Recorta pelos meses antes de montar as chaves das linhas da tabela fato
+    candidates = df[df['Mês'].isin(keys.get_level_values('Mês'))]
+    touched = pd.MultiIndex.from_frame(candidates[CITY_MONTH_KEY].astype(object)).isin(keys)
+    rebuilt = build_city_month_totals(candidates[touched])
+    return pd.concat([kept, rebuilt]).sort_index()
+
+
+def select_city_months(city_month, months=None, estados=None, cidades=None):
+    """Linhas da tabela cidade-mês que atendem aos filtros (listas vazias não filtram)."""
+    index = city_month.index
+    mask = np.ones(len(city_month), dtype=bool)
+    if months:
+        mask &= index.get_level_values('Mês').isin(months)
+    if estados:
+        mask &= index.get_level_values('Estado').isin(estados)
+    if cidades:
+        mask &= index.get_level_values('Cidade').isin(cidades)
+    return city_month[mask]
+
+
+def city_month_totals(city_month):
+    """(faturamento, pedidos) totais de um recorte da tabela cidade-mês."""
+    return (
+        city_month['Faturamento Total da Cidade no Mês'].sum(),
+        city_month['Total de Pedidos da Cidade no Mês'].sum(),
+    )
+
+
+TOP_DIMENSIONS = ['Produto', 'Cidade', 'Estado']
+TOP_METRICS = ['Faturamento do Produto', 'Unidades Compradas', 'Pedidos com Produto']
+
+
+def top_positions(values, n):
+    """
+    Índices dos `n` maiores valores, em ordem decrescente, via seleção parcial.
+    Empates são resolvidos pela posição, como `nlargest(keep='first')`.
+    """
+    if n >= len(values):
+        candidates = np.arange(len(values))
+    else:
+        kth = np.partition(values, len(values) - n)[len(values) - n]
+        greater = np.flatnonzero(values > kth)
+        equal = np.flatnonzero(values == kth)[:n - len(greater)]
+        candidates = np.concatenate([greater, equal])
+    return candidates[np.lexsort((candidates, -values[candidates]))]
+
+
+def totals_nbytes(totals):
+    """Bytes das tabelas de totais por dimensão, para os limites do cache de resultados."""
+    return sum(int(frame.memory_usage(deep=False).sum()) for frame in totals.values())
+
+
+class TopNAggregate:
+    """
+    Totais de todas as métricas de Top-N para todas as dimensões de uma seleção.
+
+    Calculado uma vez por estado dos filtros, com uma só seleção e leitura das
+    métricas para todas as dimensões; trocar a métrica ou o N depois disso é
+    só uma seleção parcial sobre os totais já agregados.
+    """
+
+    def __init__(self, backend, selection, dimensions=TOP_DIMENSIONS, metrics=TOP_METRICS):
+        self._totals = backend.group_totals_by(selection, list(dimensions), metrics)
+
+    def totals(self, dim):
+        return self._totals[dim]
+
+    def __sizeof__(self):
+        return totals_nbytes(self._totals)
+
+    def top(self, dim, metric, n):
+        """DataFrame [dim, 'Total'] com os `n` maiores grupos pela métrica."""
+        totals = self._totals[dim][metric]
+        picked = top_positions(totals.to_numpy(), n)
+        return pd.DataFrame({dim: totals.index[picked], 'Total': totals.to_numpy()[picked]})
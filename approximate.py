@@ -0,0 +1,231 @@
+"""
+Resultados aproximados para seleções muito grandes (modo progressivo).
+
+Uma amostra estratificada por estado x mês é sorteada uma vez por versão dos
+dados: cada estrato contribui com uma fração fixa das suas linhas (com um
+mínimo por estrato). KPIs e Top-N de uma seleção são estimados expandindo a
+amostra pelos pesos dos estratos (estimador de Horvitz-Thompson por domínio),
+com intervalos de 95% calculados pela variância estratificada com correção de
+população finita. No Top-N, a confiança de cada item é a probabilidade
+(aproximação normal) de ele estar à frente do primeiro item fora da lista.
+
+O app mostra as estimativas enquanto os valores exatos são calculados em
+segundo plano por `ExactJobs` e os substitui assim que ficam prontos.
+"""
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from aggregates import TOP_DIMENSIONS, TOP_METRICS, top_positions, totals_nbytes
+from schema import get_column
+
+logger = logging.getLogger(__name__)
+
+STRATA_DIMENSIONS = ('Estado', 'Mês')
+SAMPLE_METRICS = ['Faturamento do Produto', 'Pedidos com Produto', 'Unidades Compradas']
+PARTICIPATION = 'Participação Faturamento Cidade Mês (%)'
+Z_95 = 1.959964
+
+
+def normal_cdf(z):
+    return 0.5 * (1.0 + np.vectorize(math.erf, otypes=[float])(np.asarray(z, dtype=float) / math.sqrt(2.0)))
+
+
+@dataclass
+class Estimate:
+    """Total estimado e meia-largura do intervalo de 95%."""
+    value: float
+    error: float
+
+
+class StratifiedSample:
+    """
+    Amostra estratificada da tabela fato: posições sorteadas, estrato de cada
+    linha, tamanhos dos estratos na tabela (N) e na amostra (n), e as métricas
+    e códigos das dimensões já recortados para as linhas da amostra.
+    """
+
+    def __init__(self, frame, filter_index, fraction=0.01, min_per_stratum=30, seed=0):
+        self.filter_index = filter_index
+        self.fraction = fraction
+        # Códigos -1 (valor ausente) viram um estrato próprio
+        strata = np.zeros(len(frame), dtype=np.int64)
+        for dim in STRATA_DIMENSIONS:
+            codes = filter_index.codes[dim].astype(np.int64) + 1
+            strata = strata * (len(filter_index.categories[dim]) + 1) + codes
+        strata_ids, strata = np.unique(strata, return_inverse=True)
+        self.population = np.bincount(strata, minlength=len(strata_ids))
+        self.sizes = np.minimum(
+            self.population,
+            np.maximum(min_per_stratum, np.ceil(self.population * fraction)).astype(np.int64),
+        )
+
+        # Sorteio sem reposição: ordem aleatória dentro de cada estrato, pega os n primeiros
+        rng = np.random.default_rng(seed)
+        order = np.lexsort((rng.random(len(frame)), strata))
+        starts = np.concatenate([[0], np.cumsum(self.population)[:-1]])
+        rank = np.arange(len(frame)) - starts[strata[order]]
+        positions = np.sort(order[rank < self.sizes[strata[order]]])
+
+        self.positions = positions
+        self.strata = strata[positions]
+        self.codes = {dim: filter_index.codes[dim][positions] for dim in filter_index.codes}
+        self.values = {
+            col: get_column(frame, col).to_numpy(dtype='float64')[positions]
+            for col in SAMPLE_METRICS + [PARTICIPATION]
+        }
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __sizeof__(self):
+        arrays = [self.positions, self.strata, self.population, self.sizes,
+                  *self.codes.values(), *self.values.values()]
+        return sum(array.nbytes for array in arrays)
+
+    def mask(self, selection):
+        """Linhas da amostra que atendem à seleção {dimensão: valores}."""
+        mask = np.ones(len(self), dtype=bool)
+        for dim, values in selection.items():
+            if not values:
+                continue
+            wanted = np.zeros(len(self.filter_index.categories[dim]) + 1, dtype=bool)
+            wanted[self.filter_index.value_codes(dim, values)] = True
+            # O último item de `wanted` recebe o código -1 (ausente), nunca selecionado
+            mask &= wanted[self.codes[dim]]
+        return mask
+
+    def _totals(self, strata, groups, n_groups, values):
+        """Totais estimados e variâncias por grupo, a partir das linhas selecionadas."""
+        pairs = strata * n_groups + groups
+        keys, inverse = np.unique(pairs, return_inverse=True)
+        s1 = np.bincount(inverse, weights=values, minlength=len(keys))
+        s2 = np.bincount(inverse, weights=values * values, minlength=len(keys))
+        stratum = keys // n_groups
+        N = self.population[stratum].astype('float64')
+        n = self.sizes[stratum].astype('float64')
+        # Variância amostral de y * 1[domínio] no estrato inteiro (zeros fora do domínio)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s2_h = np.where(n > 1, (s2 - s1 * s1 / n) / (n - 1), 0.0)
+        variance = N * N * (1 - n / N) / n * np.maximum(s2_h, 0.0)
+        group = keys % n_groups
+        totals = np.bincount(group, weights=s1 * N / n, minlength=n_groups)
+        variances = np.bincount(group, weights=variance, minlength=n_groups)
+        return totals, variances
+
+    def estimate_sums(self, selection, columns):
+        """{coluna: Estimate} das somas sobre a seleção."""
+        mask = self.mask(selection)
+        strata = self.strata[mask]
+        groups = np.zeros(len(strata), dtype=np.int64)
+        result = {}
+        for col in columns:
+            totals, variances = self._totals(strata, groups, 1, self.values[col][mask])
+            result[col] = Estimate(float(totals[0]), Z_95 * math.sqrt(variances[0]))
+        return result
+
+    def estimate_mean(self, selection, column):
+        """Média estimada (razão dos totais expandidos), NaN sem linhas na amostra."""
+        mask = self.mask(selection)
+        weights = (self.population / self.sizes)[self.strata[mask]]
+        if not weights.sum():
+            return np.nan
+        return float((weights * self.values[column][mask]).sum() / weights.sum())
+
+    def group_estimates(self, selection, dim, metrics):
+        """DataFrame de totais estimados por valor de `dim` e as meias-larguras ('<métrica> Erro')."""
+        mask = self.mask(selection)
+        strata = self.strata[mask]
+        codes = self.codes[dim][mask].astype(np.int64)
+        valid = codes >= 0
+        strata, codes = strata[valid], codes[valid]
+        n_groups = len(self.filter_index.categories[dim])
+        observed = np.flatnonzero(np.bincount(codes, minlength=n_groups))
+        columns = {}
+        for metric in metrics:
+            totals, variances = self._totals(strata, codes, n_groups, self.values[metric][mask][valid])
+            columns[metric] = totals[observed]
+            columns[f'{metric} Erro'] = Z_95 * np.sqrt(variances[observed])
+        return pd.DataFrame(columns, index=self.filter_index.categories[dim][observed])
+
+
+class ApproximateTopN:
+    """Mesma interface de `TopNAggregate`, com erro e confiança de ranking no Top-N."""
+
+    approximate = True
+
+    def __init__(self, sample, selection, dimensions=TOP_DIMENSIONS, metrics=TOP_METRICS):
+        self._totals = {dim: sample.group_estimates(selection, dim, metrics) for dim in dimensions}
+
+    def totals(self, dim):
+        return self._totals[dim][[col for col in self._totals[dim].columns if not col.endswith(' Erro')]]
+
+    def __sizeof__(self):
+        return totals_nbytes(self._totals)
+
+    def top(self, dim, metric, n):
+        """DataFrame [dim, 'Total', 'Erro', 'Confiança'] com os `n` maiores grupos estimados."""
+        frame = self._totals[dim]
+        totals = frame[metric].to_numpy()
+        errors = frame[f'{metric} Erro'].to_numpy()
+        ranked = top_positions(totals, min(n + 1, len(totals)))
+        picked, rest = ranked[:n], ranked[n:]
+        if len(rest):
+            # Probabilidade de cada item estar à frente do primeiro que ficou de fora
+            sigma = np.sqrt((errors[picked] / Z_95) ** 2 + (errors[rest[0]] / Z_95) ** 2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z = np.where(sigma > 0, (totals[picked] - totals[rest[0]]) / sigma, np.inf)
+            confidence = normal_cdf(z)
+        else:
+            confidence = np.ones(len(picked))
+        return pd.DataFrame({
+            dim: frame.index[picked],
+            'Total': totals[picked],
+            'Erro': errors[picked],
+            'Confiança': confidence,
+        })
+
+
+class ExactJobs:
+    """
+    Cálculos exatos em segundo plano. O resultado vai para o cache de
+    resultados com a chave informada; cada chave roda no máximo uma vez por
+    vez, e uma falha fica registrada para não ser repetida a cada consulta.
+    """
+
+    def __init__(self, result_cache, workers=2):
+        self.result_cache = result_cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='topcity-exato')
+        self._pending = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def start(self, key, compute):
+        """Inicia o cálculo, se a chave não estiver em cache, em cálculo ou com falha."""
+        with self._lock:
+            if key in self._pending or key in self.errors or key in self.result_cache:
+                return
+            self._pending[key] = self._pool.submit(self._run, key, compute)
+
+    def _run(self, key, compute):
+        try:
+            value = compute()
+            self.result_cache.put(key, value)
+            return value
+        except Exception as e:
+            logger.warning("Falha no cálculo exato de %s: %s", key[0], e)
+            self.errors[key] = e
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def pending(self, keys):
+        """Chaves ainda em cálculo."""
+        with self._lock:
+            return [key for key in keys if key in self._pending]
@@ -0,0 +1,212 @@
+"""
+Benchmarks do pipeline do dashboard em volumes crescentes de dados sintéticos.
+
+Mede cada etapa (ingestão, snapshot, índices, filtros, KPIs, Top-N,
+comparativos, tabela e exportação) pela API de `topcity_core`, sem Streamlit.
+O resultado pode ser gravado como baseline e comparado em execuções futuras:
+
+    python benchmark.py --rows 10000,100000,1000000 --save-baseline bench.json
+    python benchmark.py --rows 10000,100000 --baseline bench.json --tolerance 0.25
+
+A comparação termina com código 1 quando alguma etapa fica mais lenta que a
+baseline além da tolerância. `--backend duckdb` mede as agregações no motor
+DuckDB e `--check-parity` confere, no volume medido, se todos os motores
+disponíveis dão os mesmos resultados que a referência pandas (os casos de
+borda ficam em `tests/test_backend_parity.py`):
+
+    python benchmark.py --rows 1000000 --backend duckdb --check-parity
+"""
+import argparse
+import dataclasses
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import topcity_core as core
+from data_loader import CsvFileSource, SnapshotStore, load_snapshot, parse_raw, process_data
+from dataset import Dataset
+from formatting import format_frame_br
+from aggregates import TOP_DIMENSIONS, TOP_METRICS
+from pagination import PagedView, sort_permutation
+from query_backend import available_backends, make_backend
+from synthetic_data import generate_raw, write_csv
+from streaming_ingest import ingest_csv
+
+DATA_DIR = '.bench_data'
+
+
+def dataset_csv(n_rows, seed, data_dir=DATA_DIR):
+    """CSV sintético do volume pedido, gerado uma vez e reaproveitado."""
+    path = os.path.join(data_dir, f"synthetic-{n_rows}-{seed}.csv")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        write_csv(generate_raw(n_rows, seed=seed), path + '.tmp')
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def time_best(fn, repeat):
+    """Menor tempo (s) entre `repeat` execuções, e o último resultado."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def sample_selections(dataset, seed=0):
+    """Seleções típicas da sidebar: padrão, um estado, poucas cidades e com produtos."""
+    index = dataset.filter_index
+    rng = np.random.default_rng(seed)
+    months = list(index.categories['Mês'])
+    estados = list(index.categories['Estado'])
+    cidades = list(index.categories['Cidade'])
+    produtos = list(index.categories['Produto'])
+    return {
+        'padrao': core.Selection.of(months[-3:], estados[:5], cidades[:10]),
+        'estado': core.Selection.of(months[-6:], estados[:1]),
+        'tudo': core.Selection.of(months),
+        'produtos': core.Selection.of(months[-3:], None, None, rng.choice(produtos, size=min(5, len(produtos)), replace=False)),
+    }
+
+
+def _same(a, b, rtol):
+    if isinstance(a, pd.DataFrame):
+        if not a.index.equals(b.index) or list(a.columns) != list(b.columns):
+            return False
+        return all(_same(a[col].to_numpy(), b[col].to_numpy(), rtol) for col in a.columns)
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype.kind in 'fiu' and b.dtype.kind in 'fiu':
+        return a.shape == b.shape and np.allclose(a, b, rtol=rtol, atol=1e-9, equal_nan=True)
+    return np.array_equal(a, b)
+
+
+def check_parity(dataset, selections, backends, rtol=1e-9):
+    """Cálculos em que algum motor difere da referência pandas: [(motor, seleção, cálculo)]."""
+    reference = dataclasses.replace(dataset, backend=make_backend('pandas', dataset.frame, dataset.filter_index))
+    mismatches = []
+    for name in backends:
+        if name == 'pandas':
+            continue
+        other = dataclasses.replace(dataset, backend=make_backend(name, dataset.frame, dataset.filter_index))
+        for label, selection in selections.items():
+            checks = {'kpis': (core.calculate_kpis(reference, selection), core.calculate_kpis(other, selection))}
+            top_ref, top_other = core.top_aggregate(reference, selection), core.top_aggregate(other, selection)
+            for dim in TOP_DIMENSIONS:
+                checks[f'top_{dim}'] = (top_ref.totals(dim), top_other.totals(dim))
+                for metric in TOP_METRICS:
+                    checks[f'top_{dim}_{metric}'] = (top_ref.top(dim, metric, 10), top_other.top(dim, metric, 10))
+            checks['mensal'] = (core.monthly_base(reference, selection), core.monthly_base(other, selection))
+            for check, (expected, actual) in checks.items():
+                if not _same(expected, actual, rtol):
+                    mismatches.append((name, label, check))
+    return mismatches
+
+
+def stream_csv(source):
+    with source.open() as stream:
+        return ingest_csv(stream, size_hint=os.fstat(stream.fileno()).st_size)
+
+
+def run_scale(n_rows, repeat, seed, compact, backend='pandas', parity=False):
+    path = dataset_csv(n_rows, seed)
+    source = CsvFileSource(path)
+    timings = {}
+
+    def record(stage, fn, times=repeat):
+        timings[stage], result = time_best(fn, times)
+        return result
+
+    raw = record('leitura_csv', lambda: parse_raw(source.read_bytes()))
+    processed = record('processamento', lambda: process_data(raw.copy()))
+    streamed = record('ingestao_streaming', lambda: stream_csv(source))
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        store = SnapshotStore(snapshot_dir)
+        record('snapshot_gravacao', lambda: load_snapshot(source, store, compact=compact), times=1)
+        snapshot = record('snapshot_leitura', lambda: load_snapshot(source, store, compact=compact))
+        dataset = record('indices', lambda: Dataset.from_snapshot(snapshot, backend=backend))
+
+        for name, selection in sample_selections(dataset, seed).items():
+            record(f'filtro_{name}', lambda: core.select_positions(dataset, selection))
+            record(f'kpis_{name}', lambda: core.calculate_kpis(dataset, selection))
+            record(f'top_{name}', lambda: core.top_aggregate(dataset, selection))
+            record(f'comparativos_{name}', lambda: core.calculate_comparisons(dataset, selection))
+
+        everything = sample_selections(dataset, seed)['tudo']
+        rows = core.filter_rows(dataset, everything)
+        order = record('tabela_ordenacao', lambda: sort_permutation(rows, [('Faturamento do Produto', False)]))
+        page = PagedView(rows, order).page(1, 100)
+        record('tabela_formatacao', lambda: format_frame_br(page))
+        record('exportacao_csv', lambda: core.export_selection(dataset, everything, 'csv', rows=rows))
+
+        mismatches = check_parity(dataset, sample_selections(dataset, seed), available_backends()) if parity else []
+        if parity and not processed.equals(streamed):
+            mismatches.append(('streaming', '-', 'ingestao'))
+    return timings, mismatches
+
+
+def compare(results, baseline, tolerance):
+    """Etapas mais lentas que a baseline além da tolerância: [(chave, atual, baseline)]."""
+    regressions = []
+    for key, seconds in results.items():
+        reference = baseline.get(key)
+        # Abaixo de 1 ms o ruído domina a medida
+        if reference and seconds > max(reference * (1 + tolerance), reference + 0.001):
+            regressions.append((key, seconds, reference))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline do dashboard.")
+    parser.add_argument('--rows', default='10000,100000', help="volumes separados por vírgula")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compact', action='store_true', help="usa a representação compacta da tabela")
+    parser.add_argument('--backend', default='pandas', choices=available_backends(), help="motor das agregações")
+    parser.add_argument('--check-parity', action='store_true', help="compara os motores com a referência pandas")
+    parser.add_argument('--save-baseline', metavar='ARQUIVO')
+    parser.add_argument('--baseline', metavar='ARQUIVO')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = {}
+    mismatches = []
+    for n_rows in [int(r) for r in args.rows.split(',')]:
+        print(f"\n== {n_rows:,} linhas ({args.backend}) ==")
+        timings, scale_mismatches = run_scale(n_rows, args.repeat, args.seed, args.compact,
+                                              args.backend, args.check_parity)
+        for stage, seconds in timings.items():
+            print(f"{stage:<28}{seconds * 1000:>12.2f} ms")
+            results[f"{n_rows}:{stage}"] = seconds
+        for name, label, check in scale_mismatches:
+            print(f"DIVERGÊNCIA {name} em {label}: {check}")
+        mismatches += scale_mismatches
+
+    if args.check_parity and not mismatches:
+        print(f"\nMotores {', '.join(available_backends())} com os mesmos resultados")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nBaseline gravada em {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for key, seconds, reference in regressions:
+            print(f"REGRESSÃO {key}: {seconds * 1000:.2f} ms (baseline {reference * 1000:.2f} ms)")
+        if regressions:
+            return 1
+        print(f"\nSem regressões acima de {args.tolerance:.0%} da baseline")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
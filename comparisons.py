@@ -0,0 +1,110 @@
+"""
+Comparativos de período sobre um agregado mensal.
+
+A tabela fato é percorrida uma única vez para montar os totais por mês; o
+período atual, o período anterior de mesmo tamanho e o mesmo período do ano
+anterior saem desse agregado, em uma só passada agrupada.
+"""
+import numpy as np
+import pandas as pd
+
+from aggregates import select_city_months
+
+COMPARISON_METRICS = {
+    # métrica: (coluna com produto selecionado, coluna de total da cidade)
+    'Faturamento': ('Faturamento do Produto', 'Faturamento Total da Cidade no Mês'),
+    'Pedidos': ('Pedidos com Produto', 'Total de Pedidos da Cidade no Mês'),
+}
+CURRENT = 'Atual'
+PREVIOUS = 'Período Anterior'
+YEAR_AGO = 'Ano Anterior'
+
+
+def _as_datetime_index(values):
+    return pd.DatetimeIndex(np.asarray(values, dtype='datetime64[ns]'))
+
+
+def monthly_totals(dataset, estados=None, cidades=None, produtos=None):
+    """
+    Totais de cada métrica por mês (todos os meses) para os filtros informados.
+
+    Sem produto selecionado usa a tabela cidade-mês; com produtos, soma as
+    linhas selecionadas por mês no motor de consulta do dataset.
+    """
+    if not produtos:
+        city_month = select_city_months(dataset.city_month, estados=estados, cidades=cidades)
+        columns = {metric: city_col for metric, (_, city_col) in COMPARISON_METRICS.items()}
+        monthly = city_month[list(columns.values())].groupby(level='Mês', observed=True).sum()
+        monthly = monthly.rename(columns={v: k for k, v in columns.items()})
+        monthly.index = _as_datetime_index(monthly.index)
+        return monthly
+
+    columns = {product_col: metric for metric, (product_col, _) in COMPARISON_METRICS.items()}
+    selection = {'Estado': estados, 'Cidade': cidades, 'Produto': produtos}
+    monthly = dataset.backend.month_totals(selection, list(columns)).rename(columns=columns)
+    monthly.index = _as_datetime_index(monthly.index)
+    return monthly
+
+
+def shift_months(months, offset):
+    """Desloca os meses em `offset` meses (negativo = para trás)."""
+    periods = _as_datetime_index(months).to_period('M') + offset
+    return periods.to_timestamp()
+
+
+def comparison_windows(selected_months):
+    """
+    Meses de cada período comparado.
+
+    O período anterior repete o padrão da seleção deslocado pelo tamanho do
+    intervalo (do primeiro ao último mês), então seleções não contíguas são
+    comparadas mês a mês com a janela imediatamente anterior.
+    """
+    current = _as_datetime_index(sorted(set(selected_months)))
+    first, last = current[0].to_period('M'), current[-1].to_period('M')
+    span = (last - first).n + 1
+    return {
+        CURRENT: current,
+        PREVIOUS: shift_months(current, -span),
+        YEAR_AGO: shift_months(current, -12),
+    }
+
+
+def compare_periods(monthly, selected_months):
+    """
+    Frame tidy com uma linha por (métrica, comparação): valor atual, valor de
+    referência, variação absoluta e percentual e os meses de referência.
+    A variação percentual é NaN quando a referência é zero.
+    """
+    windows = comparison_windows(selected_months)
+    keys = np.concatenate([window.to_numpy() for window in windows.values()])
+    labels = np.repeat(list(windows.keys()), [len(window) for window in windows.values()])
+
+    # Uma passada: reindexa todos os meses de todos os períodos e agrupa pelo rótulo
+    values = monthly.reindex(_as_datetime_index(keys), fill_value=0)
+    totals = values.groupby(labels, sort=False).sum()
+
+    rows = []
+    for metric in monthly.columns:
+        current = totals.loc[CURRENT, metric]
+        for comparison in (PREVIOUS, YEAR_AGO):
+            reference = totals.loc[comparison, metric]
+            delta = current - reference
+            rows.append({
+                'Métrica': metric,
+                'Comparação': comparison,
+                'Atual': current,
+                'Referência': reference,
+                'Variação': delta,
+                'Variação (%)': delta / reference * 100 if reference > 0 else np.nan,
+                'Meses de Referência': windows[comparison],
+            })
+    return pd.DataFrame(rows)
+
+
+def describe_months(months):
+    """Rótulo curto dos meses: 'AAAA-MM a AAAA-MM' se contíguos, senão a lista."""
+    periods = _as_datetime_index(months).to_period('M')
+    if len(periods) > 1 and (periods[-1] - periods[0]).n + 1 == len(periods):
+        return f"{periods[0]} a {periods[-1]}"
+    return ", ".join(str(p) for p in periods)
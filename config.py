@@ -0,0 +1,66 @@
+# Configurações do dashboard, lidas de variáveis de ambiente com valores padrão
+import os
+
+# Fonte de dados: planilha do Google Sheets
+SHEET_ID = os.environ.get("TOPCITY_SHEET_ID", "14Y-V3ezwo3LsHWERhSyURCtkQdN3drzv9F5JNRQnXEc")
+TAB_NAME = os.environ.get("TOPCITY_TAB_NAME", "Produtos_Cidades_Completas")
+
+# Caminho de um CSV local que substitui a planilha (vazio = usar o Google Sheets)
+DATA_SOURCE = os.environ.get("TOPCITY_DATA_SOURCE", "")
+
+# Cache local de snapshots já processados
+SNAPSHOT_DIR = os.environ.get("TOPCITY_SNAPSHOT_DIR", ".snapshots")
+SNAPSHOT_MAX_AGE = int(os.environ.get("TOPCITY_SNAPSHOT_MAX_AGE", "300"))  # segundos
+SNAPSHOT_KEEP = int(os.environ.get("TOPCITY_SNAPSHOT_KEEP", "3"))
+
+# Representação compacta da tabela em memória (categóricas e inteiros menores)
+COMPACT_SCHEMA = os.environ.get("TOPCITY_COMPACT_SCHEMA", "0") == "1"
+
+# Cache de resultados compartilhado entre sessões
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("TOPCITY_RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_MAX_MB = int(os.environ.get("TOPCITY_RESULT_CACHE_MAX_MB", "256"))
+# Arquivos de exportação prontos (temporários "spooled"), num cache próprio e pequeno
+EXPORT_CACHE_MAX_ENTRIES = int(os.environ.get("TOPCITY_EXPORT_CACHE_MAX_ENTRIES", "8"))
+EXPORT_CACHE_MAX_MB = int(os.environ.get("TOPCITY_EXPORT_CACHE_MAX_MB", "512"))
+
+# Renderização sob demanda: só a aba visível é calculada e cada seção roda em um fragmento
+LAZY_RENDERING = os.environ.get("TOPCITY_LAZY_RENDERING", "1") == "1"
+
+# Formatação da tabela detalhada: "numeric" mantém as colunas numéricas e formata
+# só na renderização (ordenação numérica no grid); "text" converte para texto pt-BR
+TABLE_FORMAT = os.environ.get("TOPCITY_TABLE_FORMAT", "numeric")
+
+# Instrumentação por etapa (tempo, memória, linhas e cache). Também pode ser ligada
+# por um administrador com ?profile=1 na URL; os registros vão para o log em JSON lines
+PROFILING = os.environ.get("TOPCITY_PROFILING", "0") == "1"
+PROFILE_LOG = os.environ.get("TOPCITY_PROFILE_LOG", ".profiling/profile.jsonl")
+PROFILE_MEMORY = os.environ.get("TOPCITY_PROFILE_MEMORY", "1") == "1"
+
+# Motor das agregações: "pandas" (referência) ou "duckdb" (multi-thread, requer o pacote duckdb)
+QUERY_BACKEND = os.environ.get("TOPCITY_QUERY_BACKEND", "pandas")
+QUERY_THREADS = int(os.environ.get("TOPCITY_QUERY_THREADS", "0"))  # 0 = todos os núcleos
+
+# Atualização dos dados em segundo plano: intervalo em segundos (0 = sem atualização)
+REFRESH_INTERVAL = int(os.environ.get("TOPCITY_REFRESH_INTERVAL", "300"))
+
+# Ingestão incremental: fonte só com as linhas novas ou alteradas (mesmo layout da
+# planilha), mesclada por (Mês, Estado, Cidade, SKU) a cada atualização em segundo plano.
+# CSV local ou aba da mesma planilha; vazio = recarregar a fonte inteira
+DELTA_SOURCE = os.environ.get("TOPCITY_DELTA_SOURCE", "")
+DELTA_TAB_NAME = os.environ.get("TOPCITY_DELTA_TAB_NAME", "")
+
+# Fonte particionada por mês: diretório com um CSV por partição ou abas da planilha
+# separadas por vírgula (o mês AAAA-MM vem do nome). Só as partições dos meses
+# consultados são carregadas; as mais antigas, quando alguma seleção precisar
+PARTITION_DIR = os.environ.get("TOPCITY_PARTITION_DIR", "")
+PARTITION_TABS = [tab for tab in os.environ.get("TOPCITY_PARTITION_TABS", "").split(",") if tab]
+PARTITION_WORKERS = int(os.environ.get("TOPCITY_PARTITION_WORKERS", "4"))
+PARTITION_RETRIES = int(os.environ.get("TOPCITY_PARTITION_RETRIES", "3"))
+
+# Modo progressivo: seleções com ao menos PROGRESSIVE_MIN_ROWS linhas mostram primeiro
+# estimativas de uma amostra estratificada por estado x mês (com intervalos de 95%) e
+# os valores exatos, calculados em segundo plano, substituem as estimativas
+PROGRESSIVE = os.environ.get("TOPCITY_PROGRESSIVE", "1") == "1"
+PROGRESSIVE_MIN_ROWS = int(os.environ.get("TOPCITY_PROGRESSIVE_MIN_ROWS", "2000000"))
+PROGRESSIVE_SAMPLE_FRACTION = float(os.environ.get("TOPCITY_PROGRESSIVE_SAMPLE_FRACTION", "0.01"))
+PROGRESSIVE_MIN_PER_STRATUM = int(os.environ.get("TOPCITY_PROGRESSIVE_MIN_PER_STRATUM", "30"))
@@ -0,0 +1,317 @@
+"""
+Fontes de dados, processamento e cache local de snapshots do dashboard.
+
+O DataFrame já processado (colunas renomeadas e métricas derivadas) é gravado
+em disco no formato Arrow IPC, sem compressão, para poder ser lido via memory
+map. Cada snapshot é identificado pelo fingerprint da fonte que o gerou.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import urllib.request
+from dataclasses import dataclass
+from datetime import datetime
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from column_mapping import column_mapping
+from instrumentation import span
+from schema import DERIVED_COLUMNS, compact_frame, derived_column
+from streaming_ingest import ingest_csv
+
+logger = logging.getLogger(__name__)
+
+# Incrementar sempre que o processamento mudar, para invalidar snapshots antigos
+SNAPSHOT_SCHEMA = 1
+
+# Otimização: Especificar tipos de dados para acelerar o carregamento
+RAW_DTYPES = {
+    'faturamento': 'str',
+    'faturamento_total_cidade_mes': 'str',
+    'unidades_fisicas': 'float64',
+    'pedidos': 'float64',
+    'total_pedidos_cidade_mes': 'float64'
+}
+
+
+class EmptySourceError(ValueError):
+    """A fonte de dados não retornou nenhuma linha."""
+
+
+class GoogleSheetSource:
+    """Aba de uma planilha do Google Sheets exportada como CSV."""
+
+    def __init__(self, sheet_id, tab_name, timeout=60):
+        self.url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={tab_name}"
+        self.label = f"gsheet:{sheet_id}/{tab_name}"
+        self.timeout = timeout
+
+    def fingerprint(self):
+        # Não há como saber se a planilha mudou sem baixá-la
+        return None
+
+    def read_bytes(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            return response.read()
+
+
+class CsvFileSource:
+    """Arquivo CSV local com o mesmo layout da planilha."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.label = f"csv:{self.path}"
+
+    def fingerprint(self):
+        stat = os.stat(self.path)
+        key = f"{self.path}:{stat.st_size}:{stat.st_mtime_ns}"
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def read_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def open(self):
+        """Arquivo aberto para leitura em streaming."""
+        return open(self.path, 'rb')
+
+
+def build_source(spec, sheet_id, tab_name):
+    """Retorna um CSV local quando `spec` é um caminho, senão a planilha."""
+    if spec:
+        return CsvFileSource(spec)
+    return GoogleSheetSource(sheet_id, tab_name)
+
+
+def parse_raw(raw):
+    """Lê o CSV bruto exportado pela planilha."""
+    return pd.read_csv(io.BytesIO(raw), dtype=RAW_DTYPES)
+
+
+def process_data(df):
+    """
+    Converte tipos, renomeia colunas e calcula as métricas derivadas.
+    """
+    # Conversão de data otimizada
+    df['mes'] = pd.to_datetime(df['mes'], format='%Y-%m', errors='coerce')
+
+    # Conversão numérica otimizada usando vectorização
+    numeric_columns = ['faturamento', 'faturamento_total_cidade_mes']
+    for col in numeric_columns:
+        df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.'), errors='coerce').fillna(0)
+
+    # Preencher NaN com 0 para colunas numéricas
+    numeric_cols = ['unidades_fisicas', 'pedidos', 'total_pedidos_cidade_mes']
+    df[numeric_cols] = df[numeric_cols].fillna(0)
+
+    # Renomear colunas
+    df = df.rename(columns=column_mapping)
+
+    # Calcular métricas derivadas usando operações vetorizadas
+    for name in DERIVED_COLUMNS:
+        df[name] = derived_column(df, name)
+
+    return df
+
+
+@dataclass
+class Snapshot:
+    frame: pd.DataFrame
+    fingerprint: str
+    created_at: datetime
+    source: str
+    compact: bool = False
+    applied_delta: str = None  # fingerprint do último delta incremental aplicado
+
+    @property
+    def version(self):
+        return self.fingerprint[:12] + ('-c' if self.compact else '')
+
+
+class SnapshotStore:
+    """Diretório com snapshots processados em Arrow IPC e seus metadados."""
+
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep
+
+    def _key(self, fingerprint):
+        return f"v{SNAPSHOT_SCHEMA}-{fingerprint}"
+
+    def _paths(self, fingerprint):
+        base = os.path.join(self.directory, self._key(fingerprint))
+        return base + '.arrow', base + '.json'
+
+    def has(self, fingerprint):
+        data_path, meta_path = self._paths(fingerprint)
+        return os.path.exists(data_path) and os.path.exists(meta_path)
+
+    def load(self, fingerprint):
+        data_path, meta_path = self._paths(fingerprint)
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        # Sem compressão o arquivo é mapeado em memória, sem parse
+        with span('snapshot_leitura') as s:
+            table = feather.read_table(data_path, memory_map=True)
+            s.rows = table.num_rows
+        return Snapshot(
+            frame=table.to_pandas(),
+            fingerprint=fingerprint,
+            created_at=datetime.fromisoformat(meta['created_at']),
+            source=meta['source'],
+            compact=meta.get('compact', False),
+            applied_delta=meta.get('applied_delta'),
+        )
+
+    def _metas(self, prefix=''):
+        metas = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                        metas.append((json.load(f), name[:-len('.json')]))
+                except FileNotFoundError:  # removido por outro prune em paralelo
+                    continue
+        return metas
+
+    def latest(self, source=None, compact=None):
+        """Metadados do snapshot mais recente do schema atual (da fonte informada), ou None."""
+        if not os.path.isdir(self.directory):
+            return None
+        metas = [
+            meta for meta, _ in self._metas(f"v{SNAPSHOT_SCHEMA}-")
+            if (source is None or meta['source'] == source)
+            and (compact is None or meta.get('compact', False) == compact)
+        ]
+        return max(metas, key=lambda m: m['created_at'], default=None)
+
+    def save(self, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, meta_path = self._paths(snapshot.fingerprint)
+        meta = {
+            'fingerprint': snapshot.fingerprint,
+            'created_at': snapshot.created_at.isoformat(),
+            'source': snapshot.source,
+            'compact': snapshot.compact,
+            'applied_delta': snapshot.applied_delta,
+            'rows': len(snapshot.frame),
+        }
+        # Escrita atômica: outro processo nunca lê um arquivo pela metade
+        feather.write_feather(snapshot.frame, data_path + '.tmp', compression='uncompressed')
+        os.replace(data_path + '.tmp', data_path)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        self.prune()
+
+    def prune(self):
+        """
+        Remove os snapshots mais antigos além dos `keep` mais recentes de cada
+        fonte (uma fonte particionada guarda um snapshot por partição).
+        """
+        groups = {}
+        for meta, base in self._metas():
+            key = (meta.get('source'), meta.get('compact', False))
+            groups.setdefault(key, []).append((meta['created_at'], base))
+        stale = []
+        for metas in groups.values():
+            metas.sort(reverse=True)
+            stale += [base for _, base in metas[self.keep:]]
+        for base in stale:
+            for ext in ('.arrow', '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, base + ext))
+                except FileNotFoundError:
+                    pass
+
+
+def load_snapshot(source, store=None, max_age=0, compact=False, streaming=True, current=None):
+    """
+    Retorna o snapshot processado da fonte, usando o cache em disco sempre que possível.
+
+    Um snapshot da mesma fonte com menos de `max_age` segundos é servido sem
+    consultar a fonte. Caso contrário, a fonte é lida e, se o fingerprint já
+    estiver no cache, o processamento é evitado. Com `compact=True` a tabela
+    usa a representação compacta de `schema.compact_frame`.
+
+    Com `streaming=True` o CSV é processado em blocos (`streaming_ingest`);
+    fontes com fingerprint barato e `open()` são lidas direto do arquivo, sem
+    manter o conteúdo bruto em memória.
+
+    `current` é o snapshot já em memória: se o fingerprint encontrado for o
+    dele, ele próprio é devolvido, sem reler o arquivo do cache nem convertê-lo
+    de novo para pandas.
+    """
+    # A representação compacta é um snapshot distinto da mesma fonte
+    suffix = '-compact' if compact else ''
+
+    def unchanged(fingerprint):
+        return current is not None and current.fingerprint == fingerprint
+
+    if store is not None and max_age > 0:
+        meta = store.latest(source=source.label, compact=compact)
+        if meta:
+            age = time.time() - datetime.fromisoformat(meta['created_at']).timestamp()
+            if age <= max_age and unchanged(meta['fingerprint']):
+                return current
+            if age <= max_age and store.has(meta['fingerprint']):
+                return store.load(meta['fingerprint'])
+
+    fingerprint = source.fingerprint()
+    if fingerprint:
+        fingerprint += suffix
+        if unchanged(fingerprint):
+            return current
+        if store is not None and store.has(fingerprint):
+            return store.load(fingerprint)
+
+    raw = None
+    if not (streaming and fingerprint and hasattr(source, 'open')):
+        # Sem fingerprint barato o conteúdo é baixado para calcular o hash
+        with span('download'):
+            raw = source.read_bytes()
+        fingerprint = fingerprint or hashlib.sha256(raw).hexdigest() + suffix
+        if unchanged(fingerprint):
+            return current
+        if store is not None and store.has(fingerprint):
+            return store.load(fingerprint)
+
+    if streaming:
+        with span('ingestao') as s:
+            with (source.open() if raw is None else io.BytesIO(raw)) as stream:
+                size = os.fstat(stream.fileno()).st_size if raw is None else len(raw)
+                raw = None  # o BytesIO mantém a referência só até o fim da leitura
+                df = ingest_csv(stream, size_hint=size, compact=compact)
+            s.rows = len(df)
+    else:
+        with span('parse') as s:
+            df = parse_raw(raw)
+            s.rows = len(df)
+    if df.empty:
+        raise EmptySourceError(source.label)
+
+    with span('processamento'):
+        if not streaming:
+            df = process_data(df)
+        if compact:
+            df, report = compact_frame(df)
+            logger.info("Tabela compactada: %s", report)
+
+    snapshot = Snapshot(
+        frame=df,
+        fingerprint=fingerprint,
+        created_at=datetime.now(),
+        source=source.label,
+        compact=compact,
+    )
+    if store is not None:
+        try:
+            with span('snapshot_gravacao'):
+                store.save(snapshot)
+        except OSError as e:
+            logger.warning("Não foi possível gravar o snapshot em %s: %s", store.directory, e)
+    return snapshot
@@ -0,0 +1,99 @@
+"""
+Tabela fato carregada junto com as estruturas derivadas dela.
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import pandas as pd
+
+from aggregates import DIVERGENT_COLUMN, build_city_month_totals, update_city_month_totals
+from approximate import StratifiedSample
+from dimension_catalog import DimensionCatalog
+from filter_engine import FilterIndex
+from data_loader import Snapshot
+from instrumentation import span
+from query_backend import PandasBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Dataset:
+    frame: pd.DataFrame
+    city_month: pd.DataFrame
+    filter_index: FilterIndex
+    catalog: DimensionCatalog
+    version: str
+    created_at: datetime
+    backend: PandasBackend
+    snapshot: Snapshot = None
+    # Amostra do modo progressivo: sorteada na primeira vez e mantida enquanto o Dataset viver
+    _sample: StratifiedSample = field(default=None, init=False, repr=False, compare=False)
+    _sample_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, backend='pandas', threads=0, city_month=None):
+        if city_month is None:
+            with span('tabela_cidade_mes'):
+                city_month = build_city_month_totals(snapshot.frame)
+        divergent = int(city_month[DIVERGENT_COLUMN].sum())
+        if divergent:
+            logger.warning("%d cidades-mês com totais divergentes entre produtos", divergent)
+        with span('indice_filtros'):
+            filter_index = FilterIndex(snapshot.frame)
+        with span('catalogo_dimensoes'):
+            catalog = DimensionCatalog(filter_index)
+        with span(f'motor_{backend}'):
+            query_backend = make_backend(backend, snapshot.frame, filter_index, threads=threads)
+        return cls(
+            frame=snapshot.frame,
+            city_month=city_month,
+            filter_index=filter_index,
+            catalog=catalog,
+            version=snapshot.version,
+            created_at=snapshot.created_at,
+            backend=query_backend,
+            snapshot=snapshot,
+        )
+
+    def with_delta(self, snapshot, city_months, threads=0):
+        """
+        Dataset de um snapshot que difere deste só nas `city_months` (MultiIndex
+        de (Mês, Estado, Cidade), ingestão incremental): a tabela cidade-mês é
+        recalculada apenas nessas cidades-mês.
+        """
+        with span('tabela_cidade_mes_delta'):
+            city_month = update_city_month_totals(self.city_month, snapshot.frame, city_months)
+        return Dataset.from_snapshot(snapshot, backend=self.backend.name, threads=threads, city_month=city_month)
+
+    def stratified_sample(self, fraction, min_per_stratum):
+        """
+        Amostra estratificada da tabela, sorteada uma vez por Dataset (isto é,
+        por versão) como o catálogo; fica fora do cache de resultados para
+        nunca ser removida e refeita no meio de uma página.
+        """
+        with self._sample_lock:
+            if self._sample is None:
+                with span('amostra_estratificada') as s:
+                    self._sample = StratifiedSample(self.frame, self.filter_index, fraction, min_per_stratum)
+                    s.rows = len(self._sample)
+            return self._sample
+
+    def select(self, months=None, estados=None, cidades=None, produtos=None):
+        """Posições das linhas que atendem aos filtros da sidebar (None = todas)."""
+        selection = {'Mês': months, 'Estado': estados, 'Cidade': cidades, 'Produto': produtos}
+        return self.filter_index.select(selection)
+
+    def take(self, positions):
+        """Linhas nas posições informadas, sem copiar a tabela quando `positions` é None."""
+        return self.frame if positions is None else self.frame.iloc[positions]
+
+    def filter(self, months=None, estados=None, cidades=None, produtos=None):
+        """Linhas da tabela fato que atendem aos filtros da sidebar."""
+        return self.take(self.select(months, estados, cidades, produtos))
+
+    def divergent_city_months(self):
+        """Cidades-mês cujas linhas de produto discordam nos totais."""
+        return self.city_month[self.city_month[DIVERGENT_COLUMN]]
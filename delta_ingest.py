@@ -0,0 +1,159 @@
+"""
+Ingestão incremental: aplica ao snapshot atual só as linhas alteradas.
+
+A fonte de delta tem o mesmo layout da planilha, mas apenas as linhas novas
+ou modificadas (ex.: a aba do mês corrente). As linhas são processadas
+sozinhas e mescladas à tabela pela chave (Mês, Estado, Cidade, SKU) com
+semântica de upsert: chaves existentes são atualizadas no lugar e chaves novas
+vão para o fim da tabela. O Estado faz parte da chave porque nomes de cidade se
+repetem entre estados. Nos agregados só as cidades-mês presentes no delta são
+recalculadas (ver `Dataset.with_delta`).
+"""
+import hashlib
+import logging
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_loader import parse_raw, process_data
+from instrumentation import span
+from schema import compact_frame
+
+logger = logging.getLogger(__name__)
+
+DELTA_KEY = ['Mês', 'Estado', 'Cidade', 'SKU']
+CITY_MONTH_KEY = ['Mês', 'Estado', 'Cidade']
+
+
+@dataclass
+class DeltaReport:
+    months: list
+    city_months: pd.MultiIndex  # (Mês, Estado, Cidade) tocados pelo delta
+    updated: int
+    inserted: int
+
+    def __str__(self):
+        months = ', '.join(pd.Timestamp(m).strftime('%Y-%m') for m in self.months)
+        return f"{self.updated} linhas atualizadas, {self.inserted} inseridas ({months})"
+
+
+def delta_fingerprint(source, raw=None):
+    """Fingerprint da fonte de delta; sem um barato, o hash do conteúdo."""
+    fingerprint = source.fingerprint()
+    if fingerprint:
+        return fingerprint
+    return hashlib.sha256(raw if raw is not None else source.read_bytes()).hexdigest()
+
+
+def _align(base, delta):
+    """Valores da base e do delta como arrays do mesmo tipo (categóricas viram códigos comuns)."""
+    if isinstance(base.dtype, pd.CategoricalDtype):
+        delta = delta.astype(object) if isinstance(delta.dtype, pd.CategoricalDtype) else delta
+        new = pd.Index(delta.dropna().unique()).difference(base.cat.categories)
+        dtype = base.dtype
+        if len(new):
+            categories = base.cat.categories.append(new).sort_values()
+            dtype = pd.CategoricalDtype(categories, ordered=base.cat.ordered)
+            base = base.cat.set_categories(categories)
+        return base.cat.codes.to_numpy(), pd.Categorical(delta, dtype=dtype).codes, dtype
+    values = base.to_numpy()
+    delta_values = delta.to_numpy()
+    dtype = values.dtype
+    if dtype.kind in 'iu':
+        # Contadores compactos só continuam inteiros se o delta couber no tipo
+        as_int = delta_values.astype(dtype)
+        if not np.array_equal(as_int, delta_values):
+            dtype = np.result_type(dtype, delta_values.dtype)
+            return values.astype(dtype), delta_values.astype(dtype), dtype
+        delta_values = as_int
+    elif dtype.kind != 'O':
+        delta_values = delta_values.astype(dtype)
+    return values, delta_values, dtype
+
+
+def merge_delta(base, delta):
+    """
+    Upsert de `delta` em `base` pela chave (Mês, Estado, Cidade, SKU);
+    retorna (tabela, DeltaReport). Em chaves repetidas no delta vale a última
+    linha; uma chave que aparece mais de uma vez na base é ambígua e gera
+    ValueError, sem alterar nenhuma linha.
+    """
+    delta = delta.drop_duplicates(DELTA_KEY, keep='last').reset_index(drop=True)
+    months = pd.Index(delta['Mês'].dropna().unique()).sort_values()
+
+    # Só linhas dos meses do delta podem coincidir com alguma chave
+    candidates = np.flatnonzero(base['Mês'].isin(months).to_numpy())
+    base_keys = base.iloc[candidates][DELTA_KEY].astype(object).assign(_base=candidates)
+    delta_keys = delta[DELTA_KEY].astype(object).assign(_delta=np.arange(len(delta)))
+    matches = base_keys.merge(delta_keys, on=DELTA_KEY, how='inner')
+    ambiguous = matches[matches.duplicated('_delta', keep=False)]
+    if len(ambiguous):
+        example = ', '.join(str(v) for v in ambiguous.iloc[0][DELTA_KEY])
+        raise ValueError(
+            f"Delta ambíguo: {ambiguous['_delta'].nunique()} chave(s) aparecem mais de uma vez "
+            f"na base (ex.: {example})"
+        )
+    first = matches.set_index('_delta')['_base']
+    inserted = np.setdiff1d(np.arange(len(delta)), first.index.to_numpy())
+
+    columns = {}
+    for col in base.columns:
+        values, delta_values, dtype = _align(base[col], delta[col])
+        values = values.copy()
+        values[first.to_numpy()] = delta_values[first.index.to_numpy()]
+        merged = np.concatenate([values, delta_values[inserted]])
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[col] = pd.Categorical.from_codes(merged, dtype=dtype)
+        else:
+            columns[col] = merged
+    frame = pd.DataFrame(columns)
+    city_months = pd.MultiIndex.from_frame(delta[CITY_MONTH_KEY].astype(object).drop_duplicates())
+    report = DeltaReport(months=list(months), city_months=city_months, updated=len(first), inserted=len(inserted))
+    return frame, report
+
+
+def apply_delta(snapshot, source, store=None):
+    """
+    Aplica a fonte de delta ao snapshot. Retorna (snapshot, DeltaReport), ou
+    (o mesmo snapshot, None) quando esse delta já foi aplicado ou está vazio.
+    """
+    with span('delta_leitura'):
+        raw = source.read_bytes()
+    fingerprint = delta_fingerprint(source, raw)
+    if fingerprint == snapshot.applied_delta:
+        return snapshot, None
+
+    with span('delta_processamento') as s:
+        try:
+            delta = parse_raw(raw)
+        except pd.errors.EmptyDataError:
+            delta = pd.DataFrame()
+        s.rows = len(delta)
+        if delta.empty:
+            return snapshot, None
+        delta = process_data(delta)
+        if snapshot.compact:
+            delta, _ = compact_frame(delta)
+        delta = delta.reindex(columns=snapshot.frame.columns)
+
+    with span('delta_mescla') as s:
+        frame, report = merge_delta(snapshot.frame, delta)
+        s.rows = len(frame)
+    logger.info("Delta aplicado: %s", report)
+
+    merged = replace(
+        snapshot,
+        frame=frame,
+        fingerprint=hashlib.sha256(f"{snapshot.fingerprint}:{fingerprint}".encode('utf-8')).hexdigest(),
+        created_at=datetime.now(),
+        applied_delta=fingerprint,
+    )
+    if store is not None:
+        try:
+            with span('snapshot_gravacao'):
+                store.save(merged)
+        except OSError as e:
+            logger.warning("Não foi possível gravar o snapshot em %s: %s", store.directory, e)
+    return merged, report
@@ -0,0 +1,87 @@
+"""
+Catálogo das dimensões da tabela fato para as opções dos filtros.
+
+Construído uma vez por snapshot a partir dos códigos do `FilterIndex`: lista
+ordenada de valores e contagem de linhas por valor, e as relações
+estado→cidades, cidade→produtos e mês→estados/cidades/produtos com a
+contagem de linhas de cada par. As opções em cascata da sidebar são
+resolvidas nessas relações, sem varrer a tabela.
+"""
+import numpy as np
+import pandas as pd
+
+CATALOG_RELATIONS = [
+    ('Estado', 'Cidade'),
+    ('Cidade', 'Produto'),
+    ('Mês', 'Estado'),
+    ('Mês', 'Cidade'),
+    ('Mês', 'Produto'),
+]
+
+
+class _Relation:
+    """Pares (pai, filho) presentes na tabela em formato CSR, com linhas por par."""
+
+    def __init__(self, parent_codes, child_codes, n_parents, n_children):
+        valid = (parent_codes >= 0) & (child_codes >= 0)
+        keys = parent_codes[valid].astype(np.int64) * n_children + child_codes[valid]
+        n_keys = n_parents * n_children
+        # bincount é mais rápido enquanto o produto cartesiano é pequeno frente à tabela
+        if n_keys <= 4 * len(keys) + 1024:
+            counts = np.bincount(keys, minlength=n_keys)
+            pairs = np.flatnonzero(counts)
+            counts = counts[pairs]
+        else:
+            pairs, counts = np.unique(keys, return_counts=True)
+        parents = pairs // n_children
+        self.children = (pairs % n_children).astype(np.int32)
+        self.counts = counts.astype(np.int64)
+        self.offsets = np.searchsorted(parents, np.arange(n_parents + 1))
+
+    def lookup(self, parent_codes):
+        """(códigos dos filhos, linhas) somados sobre os pais informados, em ordem de código."""
+        parts = [slice(self.offsets[c], self.offsets[c + 1]) for c in parent_codes]
+        if not parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        children = np.concatenate([self.children[s] for s in parts])
+        counts = np.concatenate([self.counts[s] for s in parts])
+        codes, inverse = np.unique(children, return_inverse=True)
+        return codes, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+class DimensionCatalog:
+    def __init__(self, filter_index, relations=CATALOG_RELATIONS):
+        self._index = filter_index
+        self._values = {dim: categories.tolist() for dim, categories in filter_index.categories.items()}
+        self._relations = {
+            (parent, child): _Relation(
+                filter_index.codes[parent], filter_index.codes[child],
+                len(filter_index.categories[parent]), len(filter_index.categories[child]),
+            )
+            for parent, child in relations
+        }
+
+    def values(self, dim):
+        """Valores ordenados da dimensão (listas compartilhadas: não modificar)."""
+        return self._values[dim]
+
+    def row_counts(self, dim):
+        """Linhas por valor da dimensão."""
+        return pd.Series(self._index.value_counts(dim), index=self._index.categories[dim], name='Linhas')
+
+    def related_counts(self, parent, parent_values, child):
+        """
+        Linhas por valor de `child` entre as linhas com algum dos `parent_values`.
+        Sem valores do pai, vale a tabela inteira.
+        """
+        if not parent_values:
+            return self.row_counts(child)
+        codes, counts = self._relations[(parent, child)].lookup(self._index.value_codes(parent, parent_values))
+        return pd.Series(counts, index=self._index.categories[child][codes], name='Linhas')
+
+    def related(self, parent, parent_values, child):
+        """Valores ordenados de `child` presentes junto de algum dos `parent_values`."""
+        if not parent_values:
+            return self.values(child)
+        codes, _ = self._relations[(parent, child)].lookup(self._index.value_codes(parent, parent_values))
+        return self._index.categories[child][codes].tolist()
@@ -0,0 +1,140 @@
+"""
+Exportação dos dados filtrados em vários formatos.
+
+O arquivo é escrito em blocos de linhas num arquivo temporário "spooled"
+(memória até um limite, disco acima dele), sem montar o CSV inteiro como
+string e depois como bytes; o `ExportArtifact` guarda esse arquivo, não uma
+cópia em bytes. Os cabeçalhos seguem o `column_mapping` e os textos usam o
+padrão brasileiro (separador ';' e vírgula decimal no CSV).
+"""
+import gzip
+import io
+import tempfile
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from column_mapping import column_mapping
+from formatting import MONTH_COLUMN, format_integer_br, format_month_series
+from schema import DERIVED_COLUMNS, with_derived_columns
+
+try:
+    import openpyxl
+except ImportError:  # Excel é opcional
+    openpyxl = None
+
+EXPORT_FORMATS = {
+    # formato: (rótulo, extensão, mime)
+    'csv': ("CSV (.csv)", 'csv', 'text/csv'),
+    'csv.gz': ("CSV compactado (.csv.gz)", 'csv.gz', 'application/gzip'),
+    'parquet': ("Parquet (.parquet)", 'parquet', 'application/vnd.apache.parquet'),
+    'xlsx': ("Excel (.xlsx)", 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+EXCEL_MAX_ROWS = 1_048_575  # limite de linhas da planilha, sem o cabeçalho
+
+
+class ExportTooLargeError(ValueError):
+    """A seleção não cabe no formato escolhido."""
+
+
+class ExportArtifact:
+    """
+    Arquivo de exportação pronto, no arquivo temporário "spooled" em que foi
+    escrito. O arquivo é fechado (e apagado, se foi para o disco) quando o
+    artefato é coletado, por exemplo depois de sair do cache de exportações.
+    """
+
+    def __init__(self, spool, extension, mime):
+        self._spool = spool
+        self._lock = threading.Lock()
+        self.size = spool.tell()
+        self.extension = extension
+        self.mime = mime
+
+    def read(self):
+        """Conteúdo do arquivo em bytes; sessões simultâneas leem uma de cada vez."""
+        with self._lock:
+            self._spool.seek(0)
+            return self._spool.read()
+
+    def __sizeof__(self):
+        # Conta o arquivo gerado nos limites em bytes dos caches
+        return self.size
+
+
+def available_formats():
+    """Formatos suportados neste ambiente (Excel depende do openpyxl)."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'xlsx' or openpyxl is not None]
+
+
+def export_columns(df):
+    """Colunas na ordem do `column_mapping`, seguidas das métricas derivadas."""
+    ordered = [col for col in column_mapping.values() if col in df.columns]
+    ordered += [col for col in DERIVED_COLUMNS if col in df.columns]
+    return ordered + [col for col in df.columns if col not in ordered]
+
+
+def _chunks(df, chunk_rows):
+    # Métricas derivadas (ausentes na representação compacta) são calculadas por bloco
+    for start in range(0, len(df), chunk_rows):
+        chunk = with_derived_columns(df.iloc[start:start + chunk_rows])
+        yield chunk[export_columns(chunk)]
+
+
+def _text_chunk(chunk):
+    return chunk.assign(**{MONTH_COLUMN: format_month_series(chunk[MONTH_COLUMN])})
+
+
+def _write_csv(df, spool, chunk_rows, compress):
+    raw = gzip.GzipFile(filename='', fileobj=spool, mode='wb', mtime=0) if compress else spool
+    # utf-8-sig para o Excel reconhecer a acentuação dos cabeçalhos
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    for i, chunk in enumerate(_chunks(df, chunk_rows)):
+        _text_chunk(chunk).to_csv(text, sep=';', decimal=',', index=False, header=(i == 0))
+    text.flush()
+    text.detach()
+    if compress:
+        raw.close()
+
+
+def _write_parquet(df, spool, chunk_rows):
+    writer = None
+    for chunk in _chunks(df, chunk_rows):
+        table = pa.Table.from_pandas(chunk, preserve_index=False, schema=writer.schema if writer else None)
+        if writer is None:
+            writer = pq.ParquetWriter(spool, table.schema, compression='zstd')
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()
+
+
+def _write_excel(df, spool, chunk_rows):
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ExportTooLargeError(f"O Excel suporta no máximo {format_integer_br(EXCEL_MAX_ROWS)} linhas")
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Dados")
+    for i, chunk in enumerate(_chunks(df, chunk_rows)):
+        if i == 0:
+            sheet.append(list(chunk.columns))
+        for row in _text_chunk(chunk).itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(spool)
+
+
+def export_frame(df, fmt, chunk_rows=100_000, spool_max_bytes=32 * 1024 * 1024):
+    """Gera o arquivo de exportação de `df` no formato `fmt` num arquivo temporário "spooled"."""
+    _, extension, mime = EXPORT_FORMATS[fmt]
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    try:
+        if fmt in ('csv', 'csv.gz'):
+            _write_csv(df, spool, chunk_rows, compress=(fmt == 'csv.gz'))
+        elif fmt == 'parquet':
+            _write_parquet(df, spool, chunk_rows)
+        else:
+            _write_excel(df, spool, chunk_rows)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0, io.SEEK_END)
+    return ExportArtifact(spool, extension, mime)
@@ -0,0 +1,102 @@
+"""
+Motor de filtros baseado em índices invertidos.
+
+Para cada dimensão do filtro guarda os códigos de cada linha e as posições
+das linhas agrupadas por valor (formato CSR: `order[offsets[c]:offsets[c + 1]]`
+são as linhas com o código `c`). Uma seleção parte da dimensão mais seletiva
+e verifica as demais apenas nas posições já encontradas, então o custo
+acompanha o tamanho da seleção e não o da tabela.
+"""
+import numpy as np
+import pandas as pd
+
+FILTER_DIMENSIONS = ['Mês', 'Estado', 'Cidade', 'Produto']
+
+
+def _smallest_int_dtype(max_value):
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class FilterIndex:
+    def __init__(self, df, dimensions=FILTER_DIMENSIONS):
+        self.n_rows = len(df)
+        self.codes = {}
+        self.categories = {}
+        self._order = {}
+        self._offsets = {}
+        position_dtype = np.int32 if self.n_rows < np.iinfo(np.int32).max else np.int64
+
+        for dim in dimensions:
+            series = df[dim]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes, categories = series.cat.codes.to_numpy(), series.cat.categories
+            else:
+                codes, categories = pd.factorize(series, sort=True)
+            codes = codes.astype(_smallest_int_dtype(len(categories)), copy=False)
+
+            order = np.argsort(codes, kind='stable').astype(position_dtype)
+            # Valores ausentes (código -1) ficam no início e nunca são selecionados
+            missing = int(np.count_nonzero(codes < 0))
+            counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+
+            self.codes[dim] = codes
+            self.categories[dim] = pd.Index(categories)
+            self._order[dim] = order[missing:]
+            self._offsets[dim] = np.concatenate([[0], np.cumsum(counts)])
+
+    def value_codes(self, dim, values):
+        """Códigos dos valores informados, ignorando os que não existem na tabela."""
+        codes = self.categories[dim].get_indexer(list(values))
+        return codes[codes >= 0]
+
+    def value_counts(self, dim):
+        """Linhas por código da dimensão."""
+        return np.diff(self._offsets[dim])
+
+    def count(self, dim, codes):
+        offsets = self._offsets[dim]
+        return int((offsets[codes + 1] - offsets[codes]).sum())
+
+    def positions(self, dim, codes):
+        """Posições (ordenadas) das linhas com qualquer um dos códigos."""
+        order, offsets = self._order[dim], self._offsets[dim]
+        parts = [order[offsets[c]:offsets[c + 1]] for c in codes]
+        if not parts:
+            return np.empty(0, dtype=order.dtype)
+        merged = np.concatenate(parts)
+        merged.sort()
+        return merged
+
+    def select(self, selection):
+        """
+        Posições das linhas que atendem à seleção {dimensão: valores}.
+
+        Como no filtro da sidebar, uma lista vazia não filtra a dimensão.
+        Retorna None quando nenhuma dimensão filtra (todas as linhas).
+        """
+        active = [(dim, self.value_codes(dim, values)) for dim, values in selection.items() if values]
+        if not active:
+            return None
+
+        # Começa pela dimensão mais seletiva e refina nas posições encontradas
+        active.sort(key=lambda item: self.count(*item))
+        first_dim, first_codes = active[0]
+        result = self.positions(first_dim, first_codes)
+        for dim, codes in active[1:]:
+            if len(result) == 0:
+                break
+            # Último item: destino do código -1 (valor ausente), nunca selecionado
+            wanted = np.zeros(len(self.categories[dim]) + 1, dtype=bool)
+            wanted[codes] = True
+            result = result[wanted[self.codes[dim][result]]]
+        return result
+
+    def filter(self, df, selection):
+        """Linhas de `df` que atendem à seleção, sem copiar a tabela quando nada filtra."""
+        positions = self.select(selection)
+        if positions is None:
+            return df
+        return df.iloc[positions]
@@ -0,0 +1,132 @@
+"""
+Formatação de números no padrão brasileiro (ponto no milhar, vírgula decimal).
+
+As funções escalares atendem aos cartões e métricas; as versões `_series`
+formatam colunas inteiras de uma vez, sem `.apply()` por célula. Para tabelas
+interativas, `style_frame_br` mantém as colunas numéricas e só formata na
+renderização, então a ordenação dentro do `st.dataframe` continua numérica.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CURRENCY_COLUMNS = ['Faturamento do Produto', 'Faturamento Total da Cidade no Mês', 'Ticket Médio do Produto']
+INTEGER_COLUMNS = ['Quantidade', 'Unidades Compradas', 'Pedidos com Produto', 'Total de Pedidos da Cidade no Mês']
+PERCENT_COLUMNS = ['Participação Faturamento Cidade Mês (%)', 'Participação Pedidos Cidade Mês (%)']
+MONTH_COLUMN = 'Mês'
+# Mês ausente (NaT) na tabela e nas exportações, com ou sem Styler
+MISSING_MONTH = ''
+
+
+# Helper function for Brazilian currency formatting (dot for thousands, comma for decimals)
+def format_currency_br(value):
+    if pd.isna(value) or value is None:
+        return "R$ 0,00"
+    # Format number with comma as decimal and dot as thousands, then swap them
+    s_value = "{:,.2f}".format(value) # e.g., "1,234,567.89" (US locale default)
+    # The trick: replace comma (US thousands) with a temp char, dot (US decimal) with comma, then temp char with dot
+    s_value = s_value.replace(",", "X").replace(".", ",").replace("X", ".")
+    return f"R$ {s_value}"
+
+
+# Helper function for Brazilian integer formatting (dot for thousands, no decimals)
+def format_integer_br(value):
+    if pd.isna(value) or value is None:
+        return "0"
+    # Ensure value is treated as an integer before formatting
+    int_value = int(value)
+    s_value = "{:,.0f}".format(int_value) # e.g., "1,000" (US locale default)
+    # The trick: replace comma (US thousands) with a temp char, dot (US decimal) with comma, then temp char with dot
+    s_value = s_value.replace(",", "X").replace(".", ",").replace("X", ".")
+    return s_value
+
+
+def _group_thousands(values):
+    """Inteiros não negativos -> strings com ponto a cada três dígitos (kernels do Arrow)."""
+    def group_str(group, has_higher):
+        text = pc.cast(pa.array(group), pa.string())
+        return pc.if_else(has_higher, pc.utf8_lpad(text, width=3, padding='0'), text)
+
+    rest = values // 1000
+    out = group_str(values % 1000, rest > 0)
+    while (rest > 0).any():
+        higher = rest // 1000
+        piece = group_str(rest % 1000, higher > 0)
+        out = pc.if_else(rest > 0, pc.binary_join_element_wise(piece, out, '.'), out)
+        rest = higher
+    return out
+
+
+def _to_float(series):
+    return np.nan_to_num(pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64'))
+
+
+def format_currency_br_series(series):
+    """Versão vetorizada de `format_currency_br` para uma coluna inteira."""
+    values = _to_float(series)
+    scaled = np.abs(values) * 100
+    cents = np.rint(scaled).astype(np.int64)
+    integer_part = _group_thousands(cents // 100)
+    decimals = pc.utf8_lpad(pc.cast(pa.array(cents % 100), pa.string()), width=2, padding='0')
+    # signbit também cobre -0.0, que o formato escalar exibe como '-0,00'
+    sign = pa.array(np.where(np.signbit(values), 'R$ -', 'R$ '))
+    text = pc.binary_join_element_wise(sign, integer_part, '')
+    text = pc.binary_join_element_wise(text, decimals, ',')
+    result = pd.Series(text.to_numpy(zero_copy_only=False), index=series.index, name=series.name, dtype=object)
+
+    # Meio centavo exato após a escala: o arredondamento decimal depende do valor
+    # binário original, então esses casos raros usam o formatador escalar
+    ties = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+    if len(ties):
+        result.iloc[ties] = [format_currency_br(v) for v in values[ties]]
+    return result
+
+
+def format_integer_br_series(series):
+    """Versão vetorizada de `format_integer_br` para uma coluna inteira."""
+    integers = np.trunc(_to_float(series)).astype(np.int64)
+    sign = pa.array(np.where(integers < 0, '-', ''))
+    text = pc.binary_join_element_wise(sign, _group_thousands(np.abs(integers)), '')
+    return pd.Series(text.to_numpy(zero_copy_only=False), index=series.index, name=series.name, dtype=object)
+
+
+def format_month_series(series):
+    """Mês como 'AAAA-MM', também para a representação categórica compacta."""
+    # Poucos meses distintos: formata só os valores únicos e espalha pelos códigos
+    codes, uniques = pd.factorize(series)
+    labels = pd.DatetimeIndex(uniques).strftime('%Y-%m').to_numpy(dtype=object)
+    return pd.Series(np.append(labels, MISSING_MONTH)[codes], index=series.index, name=series.name, dtype=object)
+
+
+def format_frame_br(df):
+    """Cópia de `df` com as colunas conhecidas convertidas para texto no padrão brasileiro."""
+    formatted = {}
+    for col in df.columns:
+        if col in CURRENCY_COLUMNS:
+            formatted[col] = format_currency_br_series(df[col])
+        elif col in INTEGER_COLUMNS:
+            formatted[col] = format_integer_br_series(df[col])
+        elif col == MONTH_COLUMN:
+            formatted[col] = format_month_series(df[col])
+        else:
+            formatted[col] = df[col]
+    return pd.DataFrame(formatted, index=df.index)
+
+
+def style_frame_br(df):
+    """
+    Styler que formata no padrão brasileiro só na renderização, mantendo os
+    valores numéricos (e a ordenação numérica) no `st.dataframe`.
+    """
+    def present(columns):
+        return [col for col in columns if col in df.columns]
+
+    styler = df.style
+    styler = styler.format('R$ {:,.2f}', subset=present(CURRENCY_COLUMNS), thousands='.', decimal=',')
+    styler = styler.format('{:,.0f}', subset=present(INTEGER_COLUMNS), thousands='.', decimal=',')
+    styler = styler.format('{:,.2f}%', subset=present(PERCENT_COLUMNS), thousands='.', decimal=',')
+    if MONTH_COLUMN in df.columns:
+        # na_rep: o formatador não é chamado para NaT, que não tem strftime
+        styler = styler.format(lambda month: month.strftime('%Y-%m'), subset=[MONTH_COLUMN], na_rep=MISSING_MONTH)
+    return styler
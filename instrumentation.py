@@ -0,0 +1,221 @@
+"""
+Instrumentação do caminho quente: tempo, pico de memória, linhas e uso de
+cache por etapa de cada execução do dashboard.
+
+As etapas são marcadas com `span(nome)` em qualquer módulo. O profiler ativo
+fica numa ContextVar, então cada sessão (thread do Streamlit) mede só a
+própria execução; sem profiler ativo, `span` devolve um objeto nulo
+compartilhado e o custo é o de uma leitura da ContextVar.
+
+O pico de memória vem do tracemalloc, que é global no processo: o pico de uma
+etapa só é registrado quando nenhum outro profiler mediu memória durante ela.
+Com sessões medindo ao mesmo tempo, `pico_memoria_kb` fica vazio (None) em vez
+de misturar as alocações e os `reset_peak` das outras threads.
+
+    with span('filtro') as s:
+        positions = dataset.select(...)
+        s.rows = len(positions)
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+_active = ContextVar('topcity_profiler', default=None)
+
+# tracemalloc é global no processo: fica ligado enquanto houver profilers medindo memória
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_epoch = 0  # incrementado a cada profiler que passa a medir memória
+
+
+def _sole_tracer_epoch():
+    """Época atual se só um profiler mede memória, senão None."""
+    with _tracing_lock:
+        return _tracing_epoch if _tracing_users == 1 else None
+
+
+class _NullSpan:
+    """Etapa nula usada quando a instrumentação está desligada."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'depth', 'rows', 'cache', '_start', '_mem_start', '_peak_seen', '_parent',
+                 '_epoch')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.rows = None
+        self.cache = None
+
+    def __enter__(self):
+        stack = self.profiler._stack
+        self._parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        # Só mede com este profiler sozinho no tracemalloc (reset_peak é global)
+        self._epoch = _sole_tracer_epoch() if self.profiler.track_memory else None
+        if self._epoch is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._parent is not None and self._parent._epoch == self._epoch:
+                self._parent._peak_seen = max(self._parent._peak_seen, peak)
+            tracemalloc.reset_peak()
+            self._mem_start = current
+            self._peak_seen = current
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        peak_kb = None
+        if self._epoch is not None and _sole_tracer_epoch() == self._epoch:
+            peak = max(tracemalloc.get_traced_memory()[1], self._peak_seen)
+            peak_kb = (peak - self._mem_start) / 1024
+            if self._parent is not None and self._parent._epoch == self._epoch:
+                self._parent._peak_seen = max(self._parent._peak_seen, peak)
+        self.profiler._stack.pop()
+        self.profiler.records.append({
+            'etapa': self.name,
+            'nivel': self.depth,
+            'inicio_ms': round((self._start - self.profiler._t0) * 1000, 3),
+            'duracao_ms': round(duration * 1000, 3),
+            'pico_memoria_kb': None if peak_kb is None else round(peak_kb, 1),
+            'linhas': self.rows,
+            'cache': self.cache,
+            'erro': exc_type.__name__ if exc_type else None,
+        })
+        return False
+
+
+class Profiler:
+    """Registros das etapas de uma execução (script inteiro ou fragmento)."""
+
+    def __init__(self, scope, log_path=None, track_memory=True):
+        global _tracing_users, _tracing_epoch
+        self.scope = scope
+        self.log_path = log_path
+        self.track_memory = track_memory
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now()
+        self.records = []
+        self._stack = []
+        self.finished = False
+        self.duration_ms = None
+        self._tracing = track_memory
+        if track_memory:
+            with _tracing_lock:
+                if _tracing_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                _tracing_users += 1
+                _tracing_epoch += 1
+        self._t0 = time.perf_counter()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def _release_tracing(self):
+        global _tracing_users
+        if not self._tracing:
+            return
+        self._tracing = False
+        with _tracing_lock:
+            _tracing_users -= 1
+            if _tracing_users == 0:
+                tracemalloc.stop()
+
+    def __del__(self):
+        # Execuções interrompidas (st.stop) não chegam ao finish
+        self._release_tracing()
+
+    def finish(self):
+        """Encerra a medição e grava os registros no log em JSON lines."""
+        if self.finished:
+            return
+        self.finished = True
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+        self._release_tracing()
+        if self.log_path:
+            self.write_log(self.log_path)
+
+    def write_log(self, path):
+        base = {'execucao': self.run_id, 'escopo': self.scope, 'data': self.started_at.isoformat()}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = [json.dumps({**base, **record}, ensure_ascii=False) for record in self.records]
+        lines.append(json.dumps({**base, 'etapa': 'total', 'nivel': -1, 'duracao_ms': self.duration_ms}))
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def activate(profiler):
+    """Define o profiler da execução atual (None desliga a instrumentação)."""
+    _active.set(profiler)
+
+
+def active_profiler():
+    return _active.get()
+
+
+def span(name):
+    profiler = _active.get()
+    if profiler is None or profiler.finished:
+        return NULL_SPAN
+    return profiler.span(name)
+
+
+def current_span():
+    """Etapa aberta mais interna, ou a etapa nula."""
+    profiler = _active.get()
+    if profiler is None or not profiler._stack:
+        return NULL_SPAN
+    return profiler._stack[-1]
+
+
+@contextmanager
+def section(name, start_profiler):
+    """
+    Etapa da execução em andamento ou, quando não há uma (reexecução isolada
+    de um fragmento), uma execução própria criada por `start_profiler(name)`,
+    que pode devolver None para não medir.
+    """
+    profiler = _active.get()
+    if profiler is not None and not profiler.finished:
+        with profiler.span(name) as s:
+            yield s
+        return
+    profiler = start_profiler(name)
+    if profiler is None:
+        yield NULL_SPAN
+        return
+    activate(profiler)
+    try:
+        with profiler.span(name) as s:
+            yield s
+    finally:
+        profiler.finish()
+        activate(None)
+
+
+def mark_cache(hit):
+    """Marca acerto ou falha de cache na etapa aberta mais interna."""
+    current_span().cache = 'hit' if hit else 'miss'
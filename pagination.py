@@ -0,0 +1,73 @@
+"""
+Paginação e ordenação da tabela detalhada no servidor.
+
+A ordenação é calculada uma vez por filtro e chaves de ordenação como uma
+permutação (argsort estável com várias chaves); cada página é só uma fatia
+dessa permutação, então ver a última página custa o mesmo que ver a primeira.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def _key_array(series, ascending):
+    """Valores numéricos que ordenam como a coluna (códigos para texto e categóricas)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.codes.to_numpy().astype(np.int64)
+    elif series.dtype == object:
+        values = pd.factorize(series, sort=True)[0].astype(np.int64)
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy().view(np.int64)
+    else:
+        values = series.to_numpy(dtype='float64')
+    return values if ascending else -values
+
+
+def sort_permutation(df, sort_keys, positions=None):
+    """
+    Permutação estável que ordena as linhas `positions` de `df` (None = todas)
+    por `sort_keys`, uma lista de (coluna, ascendente). Empates mantêm a ordem
+    original das linhas. Só as colunas das chaves são recortadas.
+    """
+    n_rows = len(df) if positions is None else len(positions)
+    if not sort_keys:
+        return np.arange(n_rows)
+
+    def column(col):
+        return df[col] if positions is None else df[col].take(positions)
+
+    # lexsort usa a última chave como a principal
+    keys = [_key_array(column(col), ascending) for col, ascending in reversed(sort_keys)]
+    order = np.lexsort(keys)
+    return order.astype(np.int32) if len(order) < np.iinfo(np.int32).max else order
+
+
+class PagedView:
+    """
+    Páginas das linhas `positions` de `df` (None = todas) na ordem `order`;
+    só as linhas da página são copiadas da tabela.
+    """
+
+    def __init__(self, df, order, positions=None):
+        self.df = df
+        self.order = order
+        self.positions = positions
+
+    @property
+    def total_rows(self):
+        return len(self.order)
+
+    def page_count(self, page_size):
+        return max(1, math.ceil(self.total_rows / page_size))
+
+    def page_bounds(self, page, page_size):
+        """Intervalo [início, fim) de linhas da página (1 = primeira)."""
+        start = (page - 1) * page_size
+        return start, min(start + page_size, self.total_rows)
+
+    def page(self, page, page_size, columns=None):
+        start, end = self.page_bounds(page, page_size)
+        picked = self.order[start:end]
+        rows = self.df.iloc[picked if self.positions is None else self.positions[picked]]
+        return rows if columns is None else rows[columns]
@@ -0,0 +1,171 @@
+"""
+Fonte particionada por mês (ou estado): várias abas da planilha ou vários
+arquivos CSV com o mesmo layout.
+
+Cada partição tem o próprio snapshot em cache, então só as partições que
+mudaram são processadas de novo. As partições são carregadas em paralelo por
+um pool de threads com número limitado de workers e novas tentativas. O
+`PartitionedLoader` carrega só os meses pedidos (ex.: os da seleção e dos
+comparativos) e traz as partições mais antigas sob demanda, quando alguma
+seleção precisar delas.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+
+from comparisons import comparison_windows
+from data_loader import CsvFileSource, EmptySourceError, GoogleSheetSource, Snapshot, load_snapshot
+from dataset import Dataset
+from instrumentation import span
+from schema import concat_frames
+
+logger = logging.getLogger(__name__)
+
+MONTH_PATTERN = re.compile(r'(\d{4})[-_](\d{2})')
+
+
+@dataclass
+class Partition:
+    key: str
+    source: object
+    month: pd.Timestamp = None  # None: partição sem mês (ex.: por estado), sempre carregada
+
+
+def partition_month(name):
+    """Mês no nome da partição ('vendas_2024-12.csv' -> 2024-12-01), ou None."""
+    match = MONTH_PATTERN.search(name)
+    if not match:
+        return None
+    return pd.Timestamp(year=int(match.group(1)), month=int(match.group(2)), day=1)
+
+
+def csv_partitions(directory):
+    """Um arquivo .csv do diretório por partição."""
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith('.csv'))
+    return [Partition(name, CsvFileSource(os.path.join(directory, name)), partition_month(name)) for name in names]
+
+
+def sheet_partitions(sheet_id, tab_names):
+    """Uma aba da planilha por partição."""
+    return [Partition(tab, GoogleSheetSource(sheet_id, tab), partition_month(tab)) for tab in tab_names]
+
+
+def months_needed(selected_months):
+    """Meses que a seleção e seus comparativos consultam (None = todos)."""
+    if not selected_months:
+        return None
+    windows = comparison_windows(selected_months)
+    return sorted({month for window in windows.values() for month in window})
+
+
+class PartitionedLoader:
+    """
+    Dataset montado com as partições carregadas até agora. `load(months)`
+    garante que as partições desses meses estejam presentes, carregando as
+    que faltam em paralelo; `refresh()` recarrega as que já estão em uso.
+    """
+
+    def __init__(self, partitions, store=None, compact=False, backend='pandas', threads=0,
+                 workers=4, retries=3, backoff=0.5):
+        self.partitions = sorted(partitions, key=lambda p: (p.month is None, p.month or pd.Timestamp.min, p.key))
+        self.store = store
+        self.compact = compact
+        self.backend = backend
+        self.threads = threads
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.label = 'partitions:' + ','.join(p.source.label for p in self.partitions)
+        self._snapshots = {}  # chave da partição -> Snapshot (None = partição vazia)
+        self._dataset = None
+        self._lock = threading.Lock()
+
+    @property
+    def months(self):
+        """Todos os meses da fonte, carregados ou não."""
+        return sorted({p.month for p in self.partitions if p.month is not None})
+
+    @property
+    def dataset(self):
+        return self._dataset
+
+    def covers(self, months):
+        """As partições desses meses já estão carregadas?"""
+        return all(p.key in self._snapshots for p in self._wanted(months))
+
+    def _wanted(self, months):
+        if months is None:
+            return list(self.partitions)
+        months = set(pd.DatetimeIndex(months))
+        return [p for p in self.partitions if p.month is None or p.month in months]
+
+    def _load_partition(self, partition, max_age):
+        for attempt in range(self.retries + 1):
+            try:
+                return load_snapshot(partition.source, self.store, max_age=max_age, compact=self.compact,
+                                     current=self._snapshots.get(partition.key))
+            except EmptySourceError:
+                return None
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning("Falha ao carregar a partição %s (tentativa %d): %s; nova tentativa em %.1fs",
+                               partition.key, attempt + 1, e, delay)
+                time.sleep(delay)
+
+    def _load_partitions(self, partitions, max_age):
+        with span('particoes') as s:
+            s.rows = len(partitions)
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(partitions)))) as pool:
+                snapshots = list(pool.map(lambda p: self._load_partition(p, max_age), partitions))
+        return dict(zip((p.key for p in partitions), snapshots))
+
+    def _build(self):
+        loaded = [self._snapshots[p.key] for p in self.partitions if self._snapshots.get(p.key) is not None]
+        if not loaded:
+            raise EmptySourceError(self.label)
+        with span('particoes_concat'):
+            frame = concat_frames([snapshot.frame for snapshot in loaded])
+        fingerprint = hashlib.sha256(':'.join(s.fingerprint for s in loaded).encode('utf-8')).hexdigest()
+        snapshot = Snapshot(
+            frame=frame,
+            fingerprint=fingerprint,
+            created_at=max(s.created_at for s in loaded),
+            source=self.label,
+            compact=self.compact,
+        )
+        return Dataset.from_snapshot(snapshot, backend=self.backend, threads=self.threads)
+
+    def load(self, months=None, max_age=0):
+        """Dataset com ao menos as partições dos `months` (None = todas)."""
+        with self._lock:
+            missing = [p for p in self._wanted(months) if p.key not in self._snapshots]
+            if missing or self._dataset is None:
+                self._snapshots.update(self._load_partitions(missing, max_age))
+                self._dataset = self._build()
+            return self._dataset
+
+    def refresh(self):
+        """
+        Recarrega as partições já carregadas; só as que mudaram são processadas,
+        e as inalteradas mantêm o snapshot em memória, sem reler o cache.
+        """
+        with self._lock:
+            loaded = [p for p in self.partitions if p.key in self._snapshots]
+            snapshots = self._load_partitions(loaded, max_age=0)
+            changed = any(
+                (snapshots[key] and snapshots[key].fingerprint) != (old and old.fingerprint)
+                for key, old in self._snapshots.items()
+            )
+            self._snapshots.update(snapshots)
+            if changed or self._dataset is None:
+                self._dataset = self._build()
+            return self._dataset
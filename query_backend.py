@@ -0,0 +1,197 @@
+"""
+Motores de consulta para as agregações sobre a tabela fato.
+
+Os cálculos de KPIs, Top-N e comparativos pedem ao motor somas, médias e
+totais por grupo de uma seleção {dimensão: valores}. O motor `pandas` é a
+referência: seleciona pelo `FilterIndex` e agrega com numpy em uma thread.
+O motor `duckdb` (opcional) carrega os códigos das dimensões e as métricas
+numa tabela colunar do DuckDB e executa as mesmas agregações em paralelo,
+usando todos os núcleos. Os resultados dos dois devem coincidir, a menos da
+ordem de soma em ponto flutuante; `tests/test_backend_parity.py` confere
+(KPIs, Top-N e comparativos, esquema normal e compacto, seleções vazias).
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from filter_engine import FILTER_DIMENSIONS
+from schema import DERIVED_COLUMNS, get_column
+
+try:
+    import duckdb
+except ImportError:  # DuckDB é opcional
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+QUERY_BACKENDS = ['pandas', 'duckdb']
+# Colunas com os códigos das dimensões na tabela do DuckDB
+SQL_DIMENSIONS = {'Mês': 'mes', 'Estado': 'estado', 'Cidade': 'cidade', 'Produto': 'produto'}
+
+
+def available_backends():
+    """Motores suportados neste ambiente (DuckDB depende do pacote duckdb)."""
+    return [name for name in QUERY_BACKENDS if name != 'duckdb' or duckdb is not None]
+
+
+class PandasBackend:
+    """Motor de referência: índice de filtros + numpy."""
+    name = 'pandas'
+
+    def __init__(self, frame, filter_index):
+        self.frame = frame
+        self.filter_index = filter_index
+
+    def _values(self, column, positions):
+        values = get_column(self.frame, column).to_numpy()
+        return values if positions is None else values[positions]
+
+    def aggregate(self, selection, sums=(), means=()):
+        """{coluna: soma} e {coluna: média} das linhas selecionadas, num só dicionário."""
+        positions = self.filter_index.select(selection)
+        result = {col: self._values(col, positions).sum() for col in sums}
+        for col in means:
+            values = self._values(col, positions)
+            result[col] = values.mean() if len(values) else np.nan
+        return result
+
+    def group_totals(self, selection, dim, metrics):
+        """Somas das métricas por valor de `dim` (só grupos com linhas), em ordem de código."""
+        return self.group_totals_by(selection, [dim], metrics)[dim]
+
+    def group_totals_by(self, selection, dims, metrics):
+        """
+        {dimensão: totais de `group_totals`} para várias dimensões, com uma só
+        seleção e uma só leitura das métricas; cada dimensão é um bincount.
+        """
+        positions = self.filter_index.select(selection)
+        values = {metric: self._values(metric, positions).astype('float64', copy=False) for metric in metrics}
+        result = {}
+        for dim in dims:
+            codes = self.filter_index.codes[dim]
+            if positions is not None:
+                codes = codes[positions]
+            valid = codes >= 0
+            # Sem valores ausentes na dimensão, as métricas são usadas sem cópia
+            everything = bool(valid.all())
+            if not everything:
+                codes = codes[valid]
+            n_groups = len(self.filter_index.categories[dim])
+            # Só grupos com linhas na seleção, como o groupby
+            observed = np.flatnonzero(np.bincount(codes, minlength=n_groups))
+            totals = {
+                metric: np.bincount(codes, weights=column if everything else column[valid],
+                                    minlength=n_groups)[observed]
+                for metric, column in values.items()
+            }
+            result[dim] = pd.DataFrame(totals, index=self.filter_index.categories[dim][observed])
+        return result
+
+    def month_totals(self, selection, metrics):
+        """Somas das métricas por mês, com todos os meses da tabela (zero onde não há linhas)."""
+        totals = self.group_totals(selection, 'Mês', metrics)
+        return totals.reindex(self.filter_index.categories['Mês'], fill_value=0.0)
+
+
+def _sql_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DuckDBBackend(PandasBackend):
+    """
+    Motor colunar multi-thread. A tabela do DuckDB guarda os códigos das
+    dimensões do `FilterIndex` (inteiros) e as métricas base; as derivadas
+    são calculadas na consulta.
+    """
+    name = 'duckdb'
+
+    def __init__(self, frame, filter_index, threads=0):
+        super().__init__(frame, filter_index)
+        self._connection = duckdb.connect(':memory:')
+        if threads:
+            self._connection.execute(f"SET threads = {int(threads)}")
+        self._local = threading.local()
+
+        columns = {SQL_DIMENSIONS[dim]: filter_index.codes[dim] for dim in FILTER_DIMENSIONS}
+        base_metrics = {col for col in frame.columns if pd.api.types.is_numeric_dtype(frame[col].dtype)}
+        base_metrics -= set(DERIVED_COLUMNS)
+        for col in sorted(base_metrics):
+            columns[col] = frame[col].to_numpy()
+        table = pa.table(columns)
+        self._connection.register('fato_arrow', table)
+        self._connection.execute("CREATE TABLE fato AS SELECT * FROM fato_arrow")
+        self._connection.unregister('fato_arrow')
+
+    def _cursor(self):
+        # Cada thread usa o próprio cursor (conexões do DuckDB não são thread-safe)
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._connection.cursor()
+        return cursor
+
+    def _where(self, selection):
+        clauses = []
+        for dim, values in selection.items():
+            if not values:
+                continue
+            codes = self.filter_index.value_codes(dim, values)
+            if len(codes) == 0:
+                return "WHERE FALSE"
+            clauses.append(f"{SQL_DIMENSIONS[dim]} IN ({', '.join(str(int(c)) for c in codes)})")
+        return "WHERE " + " AND ".join(clauses) if clauses else ""
+
+    def _expression(self, column):
+        if column not in DERIVED_COLUMNS:
+            return _sql_name(column)
+        numerator, denominator, scale = DERIVED_COLUMNS[column]
+        num, den = _sql_name(numerator), _sql_name(denominator)
+        return f"CASE WHEN {den} > 0 THEN CAST({num} AS DOUBLE) / {den} * {scale} ELSE 0 END"
+
+    def aggregate(self, selection, sums=(), means=()):
+        items = [f"SUM({self._expression(col)})" for col in sums]
+        items += [f"AVG({self._expression(col)})" for col in means]
+        row = self._cursor().execute(f"SELECT {', '.join(items)} FROM fato {self._where(selection)}").fetchone()
+        result = {}
+        for col, value in zip(list(sums) + list(means), row):
+            if col in sums:
+                value = 0 if value is None else value
+            result[col] = np.nan if value is None else value
+        return result
+
+    def group_totals_by(self, selection, dims, metrics):
+        # Uma varredura da tabela para todas as dimensões (GROUPING SETS)
+        keys = [SQL_DIMENSIONS[dim] for dim in dims]
+        items = ', '.join(f"SUM(CAST({self._expression(m)} AS DOUBLE))" for m in metrics)
+        sets = ', '.join(f"({key})" for key in keys)
+        query = (f"SELECT {', '.join(keys)}, GROUPING({', '.join(keys)}), {items} "
+                 f"FROM fato {self._where(selection)} GROUP BY GROUPING SETS ({sets})")
+        table = self._cursor().execute(query).fetch_arrow_table()
+        # GROUPING devolve um bit por chave, o da primeira chave no mais significativo
+        grouping = table.column(len(keys)).to_numpy()
+        columns = {metric: table.column(len(keys) + 1 + i).to_numpy() for i, metric in enumerate(metrics)}
+        result = {}
+        for i, (dim, key) in enumerate(zip(dims, keys)):
+            rows = np.flatnonzero((grouping >> (len(keys) - 1 - i)) & 1 == 0)
+            codes = table.column(i).to_numpy(zero_copy_only=False)[rows]
+            # Valores ausentes (código -1) não formam grupo
+            rows, codes = rows[codes >= 0], codes[codes >= 0]
+            order = np.argsort(codes, kind='stable')
+            rows, codes = rows[order], codes[order].astype(np.int64)
+            result[dim] = pd.DataFrame(
+                {metric: column[rows] for metric, column in columns.items()},
+                index=self.filter_index.categories[dim][codes],
+            )
+        return result
+
+def make_backend(name, frame, filter_index, threads=0):
+    """Cria o motor pedido; sem o pacote do DuckDB, volta para a referência."""
+    if name == 'duckdb':
+        if duckdb is not None:
+            return DuckDBBackend(frame, filter_index, threads=threads)
+        logger.warning("Pacote duckdb não instalado; usando o motor pandas")
+    elif name != 'pandas':
+        raise ValueError(f"Motor de consulta desconhecido: {name}")
+    return PandasBackend(frame, filter_index)
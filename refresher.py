@@ -0,0 +1,135 @@
+"""
+Atualização dos dados em segundo plano (stale-while-revalidate).
+
+Uma thread recarrega a fonte a cada intervalo enquanto as sessões continuam
+lendo o último Dataset válido. O novo Dataset só substitui o atual depois de
+validado, numa troca atômica de referência; se a fonte falhar, o anterior
+continua em uso e o erro fica registrado no status da atualização.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+from column_mapping import column_mapping
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidDatasetError(ValueError):
+    """O Dataset recarregado não passou na validação."""
+
+
+@dataclass(frozen=True)
+class RefreshStatus:
+    last_attempt: datetime = None
+    last_success: datetime = None
+    ok: bool = True
+    error: str = None
+    duration: float = None  # segundos da última tentativa
+    swapped: bool = False  # a última tentativa trocou os dados
+
+
+def validate_dataset(dataset):
+    """Rejeita tabelas vazias ou sem as colunas do `column_mapping`."""
+    if dataset.frame.empty:
+        raise InvalidDatasetError("a fonte não retornou linhas")
+    missing = [col for col in column_mapping.values() if col not in dataset.frame.columns]
+    if missing:
+        raise InvalidDatasetError(f"colunas ausentes: {', '.join(missing)}")
+
+
+class DatasetRefresher:
+    """
+    Mantém o Dataset atual e o recarrega em segundo plano.
+
+    `loader(initial, current)` devolve um Dataset; na carga inicial
+    (`initial=True`) pode servir um snapshot antigo do disco para a página abrir
+    sem esperar a fonte, e nas seguintes devolve o próprio `current` quando a
+    fonte não mudou. `on_swap(dataset)` roda na thread depois de cada troca
+    (ex.: aquecer os agregados da visão padrão); falhas nele só são registradas.
+    """
+
+    def __init__(self, loader, interval, validate=validate_dataset, on_swap=None):
+        self.loader = loader
+        self.interval = interval
+        self.validate = validate
+        self.on_swap = on_swap
+        self._dataset = None
+        self._status = RefreshStatus()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def dataset(self):
+        return self._dataset
+
+    @property
+    def status(self):
+        return self._status
+
+    def start(self):
+        """Carga inicial síncrona (erros sobem para quem chamou) e início da thread."""
+        started = time.perf_counter()
+        self._dataset = self._load(initial=True, current=None)
+        now = datetime.now()
+        self._status = RefreshStatus(last_attempt=now, last_success=now, ok=True,
+                                     duration=time.perf_counter() - started, swapped=True)
+        if self.interval > 0:
+            # Snapshot antigo servido na abertura: revalida logo em seguida
+            if (datetime.now() - self._dataset.created_at).total_seconds() > self.interval:
+                self._wake.set()
+            self._thread = threading.Thread(target=self._run, name='topcity-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def refresh_now(self):
+        """Pede uma atualização imediata à thread."""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def _load(self, initial, current):
+        dataset = self.loader(initial, current)
+        if dataset is not current:
+            self.validate(dataset)
+        return dataset
+
+    def refresh(self):
+        """Recarrega, valida e troca os dados; retorna o status da tentativa."""
+        started = time.perf_counter()
+        attempt = datetime.now()
+        try:
+            dataset = self._load(initial=False, current=self._dataset)
+        except Exception as e:
+            logger.warning("Falha ao atualizar os dados; mantendo a versão anterior: %s", e)
+            status = replace(self._status, last_attempt=attempt, ok=False, error=f"{type(e).__name__}: {e}",
+                             duration=time.perf_counter() - started, swapped=False)
+        else:
+            with self._lock:
+                # Mesma versão: mantém o objeto atual (e os resultados já em cache)
+                swapped = dataset is not self._dataset and dataset.version != self._dataset.version
+                if swapped:
+                    self._dataset = dataset
+            status = RefreshStatus(last_attempt=attempt, last_success=attempt, ok=True,
+                                   duration=time.perf_counter() - started, swapped=swapped)
+            if swapped and self.on_swap is not None:
+                try:
+                    self.on_swap(dataset)
+                except Exception as e:
+                    logger.warning("Falha após a troca dos dados: %s", e)
+        self._status = status
+        return status
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            self.refresh()
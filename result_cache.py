@@ -0,0 +1,118 @@
+"""
+Cache de resultados compartilhado entre sessões.
+
+As chaves são tuplas baratas de montar (nome do cálculo, versão do snapshot,
+assinatura dos filtros e parâmetros), então um acerto não exige hash do
+DataFrame filtrado. A remoção é LRU, limitada por número de entradas e por
+tamanho estimado em bytes.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import mark_cache
+
+
+def _canonical(values):
+    if not values:
+        return ()
+    return tuple(sorted(v.isoformat() if isinstance(v, pd.Timestamp) else str(v) for v in values))
+
+
+def filter_signature(months=None, estados=None, cidades=None, produtos=None):
+    """Assinatura canônica dos filtros: independe da ordem de seleção."""
+    return (_canonical(months), _canonical(estados), _canonical(cidades), _canonical(produtos))
+
+
+def estimate_size(value):
+    """Tamanho aproximado em bytes de um resultado."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=False)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if hasattr(value, 'to_plotly_json'):
+        # Figuras do Plotly: o tamanho está nos dados dos traços e no layout
+        return estimate_size(value.to_plotly_json())
+    # Demais objetos informam o próprio tamanho por __sizeof__ (ex.: TopNAggregate)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    def __init__(self, max_entries=512, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # chave -> (valor, tamanho)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        """Consulta sem efeitos: não conta acerto/falha nem mexe na ordem LRU."""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Retorna o valor em cache ou calcula, guarda e retorna.
+        Os valores são compartilhados entre sessões e não devem ser modificados.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        mark_cache(value is not sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
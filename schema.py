@@ -0,0 +1,121 @@
+"""
+Esquema da tabela fato e representação compacta em memória.
+
+No modo compacto as dimensões viram categóricas (dicionário + códigos), o mês
+vira uma categórica ordenada, os contadores são convertidos para inteiros
+menores e as métricas derivadas deixam de ser armazenadas: são calculadas sob
+demanda por `get_column`.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+DIMENSION_COLUMNS = ['Cidade', 'Estado', 'Produto', 'SKU']
+MONTH_COLUMN = 'Mês'
+COUNTER_COLUMNS = ['Quantidade', 'Unidades Compradas', 'Pedidos com Produto', 'Total de Pedidos da Cidade no Mês']
+
+# Métricas derivadas: nome -> (numerador, denominador, escala)
+DERIVED_COLUMNS = {
+    'Participação Faturamento Cidade Mês (%)': ('Faturamento do Produto', 'Faturamento Total da Cidade no Mês', 100),
+    'Participação Pedidos Cidade Mês (%)': ('Pedidos com Produto', 'Total de Pedidos da Cidade no Mês', 100),
+    'Ticket Médio do Produto': ('Faturamento do Produto', 'Pedidos com Produto', 1),
+}
+
+
+def derived_values(columns, name):
+    """Valores de uma métrica derivada; `columns` mapeia coluna base -> valores."""
+    numerator, denominator, scale = DERIVED_COLUMNS[name]
+    num = np.asarray(columns[numerator], dtype='float64')
+    den = np.asarray(columns[denominator], dtype='float64')
+    return np.divide(num, den, out=np.zeros(len(num)), where=den > 0) * scale
+
+
+def derived_column(df, name):
+    """Calcula uma métrica derivada a partir das colunas base."""
+    return pd.Series(derived_values(df, name), index=df.index, name=name)
+
+
+def get_column(df, name):
+    """Retorna a coluna armazenada ou, se for derivada e não estiver na tabela, a calcula."""
+    if name in df.columns or name not in DERIVED_COLUMNS:
+        return df[name]
+    return derived_column(df, name)
+
+
+def with_derived_columns(df):
+    """Garante que todas as métricas derivadas estejam presentes (ex.: para exportação)."""
+    missing = [name for name in DERIVED_COLUMNS if name not in df.columns]
+    if not missing:
+        return df
+    return df.assign(**{name: derived_column(df, name) for name in missing})
+
+
+@dataclass
+class CompactReport:
+    bytes_before: int
+    bytes_after: int
+
+    @property
+    def ratio(self):
+        return self.bytes_before / self.bytes_after if self.bytes_after else 0.0
+
+    def __str__(self):
+        mb = 1024 * 1024
+        return (f"{self.bytes_before / mb:,.1f} MB -> {self.bytes_after / mb:,.1f} MB "
+                f"({self.ratio:.1f}x menor)")
+
+
+def _downcast_counter(series):
+    # Só converte para inteiro quando não há casas decimais
+    values = series.to_numpy()
+    if values.dtype.kind == 'f' and not np.array_equal(values, np.floor(values)):
+        return series
+    # Inteiros com sinal evitam overflow ao subtrair totais (ex.: variação de pedidos)
+    return pd.to_numeric(series, downcast='integer')
+
+
+def compact_frame(df):
+    """
+    Retorna (df_compacto, CompactReport) com a representação compacta da tabela.
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+
+    columns = {}
+    for col in df.columns:
+        if col in DERIVED_COLUMNS:
+            continue
+        series = df[col]
+        if col in DIMENSION_COLUMNS:
+            series = series.astype('category')
+        elif col == MONTH_COLUMN:
+            series = series.astype(pd.CategoricalDtype(ordered=True))
+        elif col in COUNTER_COLUMNS:
+            series = _downcast_counter(series)
+        columns[col] = series
+
+    compact = pd.DataFrame(columns, index=df.index)
+    bytes_after = int(compact.memory_usage(deep=True).sum())
+    return compact, CompactReport(bytes_before, bytes_after)
+
+
+def concat_frames(frames):
+    """
+    Concatena tabelas com o mesmo esquema. Categóricas (representação
+    compacta) passam a usar a união ordenada das categorias, em vez de virar
+    texto como no `pd.concat` de categorias diferentes.
+    """
+    frames = [df for df in frames if len(df)]
+    if not frames:
+        return pd.DataFrame()
+    aligned = [df.copy(deep=False) for df in frames]
+    for col in frames[0].columns:
+        dtypes = [df[col].dtype for df in frames]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes):
+            categories = dtypes[0].categories
+            for dtype in dtypes[1:]:
+                categories = categories.union(dtype.categories)
+            categories = categories.sort_values()
+            for df in aligned:
+                df[col] = df[col].cat.set_categories(categories)
+    return pd.concat(aligned, ignore_index=True)
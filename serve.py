@@ -0,0 +1,39 @@
+"""
+Sobe o dashboard com o processo já aquecido.
+
+Carrega os dados, monta os índices e calcula os agregados da visão padrão
+(`server_state.boot`) e só então inicia o servidor do Streamlit no mesmo
+processo. O health check do Streamlit (/_stcore/health) só responde depois
+disso, então a instância fica pronta antes de receber tráfego e a primeira
+sessão já encontra tudo em memória. Os argumentos vão para `streamlit run`:
+
+    python serve.py --server.port 8501
+"""
+import logging
+import os
+import sys
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topcity_app.py')
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    import server_state
+    from warmup import format_breakdown
+
+    try:
+        _, profile = server_state.boot()
+        logger.info("Processo aquecido:\n%s", format_breakdown(profile))
+    except Exception as e:
+        # Sem os dados o servidor sobe assim mesmo: a primeira sessão tenta de novo e mostra o erro
+        logger.warning("Falha no aquecimento antes do servidor: %s", e)
+
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', APP, *(sys.argv[1:] if argv is None else argv)]
+    return cli.main()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Estado do processo compartilhado entre as sessões do dashboard.
+
+Cache de resultados, cache de exportações, carregador particionado e a
+atualização dos dados em segundo plano (com o aquecimento da primeira carga)
+existem uma vez por processo. Ficam num módulo comum, sem Streamlit, em vez de
+funções com `st.cache_resource`: assim `serve.py` cria e aquece tudo antes de o
+servidor aceitar conexões, e o script do app, executado depois no mesmo
+processo, só encontra o estado pronto.
+"""
+import threading
+
+import config
+import topcity_core as core
+from instrumentation import mark_cache
+from partitions import months_needed
+from refresher import DatasetRefresher
+from result_cache import ResultCache
+from warmup import warm_default_view, warm_up
+
+_lock = threading.RLock()
+_partition_loader = None
+_partition_loader_ready = False
+_result_cache = None
+_export_cache = None
+_refresher = None
+
+
+def result_cache():
+    """Cache de resultados único por processo, compartilhado entre sessões."""
+    global _result_cache
+    with _lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(
+                max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+                max_bytes=config.RESULT_CACHE_MAX_MB * 1024 * 1024,
+            )
+        return _result_cache
+
+
+def export_cache():
+    """Arquivos de exportação já gerados, limitados pelo tamanho somado."""
+    global _export_cache
+    with _lock:
+        if _export_cache is None:
+            _export_cache = ResultCache(
+                max_entries=config.EXPORT_CACHE_MAX_ENTRIES,
+                max_bytes=config.EXPORT_CACHE_MAX_MB * 1024 * 1024,
+            )
+        return _export_cache
+
+
+def partition_loader():
+    """Carregador da fonte particionada por mês (None sem partições configuradas)."""
+    global _partition_loader, _partition_loader_ready
+    with _lock:
+        if not _partition_loader_ready:
+            _partition_loader = core.partitioned_loader(store=core.default_store())
+            _partition_loader_ready = True
+        return _partition_loader
+
+
+def load_dataset(initial, current):
+    """
+    Carrega os dados pré-processados, usando o snapshot local quando disponível.
+    Na abertura serve o último snapshot do disco, mesmo antigo; a atualização
+    em segundo plano o revalida em seguida. Com uma fonte de delta configurada,
+    as atualizações leem só as linhas alteradas e as mesclam aos dados atuais.
+    Com uma fonte particionada, a abertura carrega só os meses do filtro padrão
+    e as atualizações recarregam as partições já em uso.
+    """
+    loader = partition_loader()
+    if loader is not None:
+        if initial:
+            recent = loader.months[-core.DEFAULT_MONTHS:]
+            return loader.load(months_needed(recent), max_age=float('inf'))
+        return loader.refresh()
+    delta = core.delta_source()
+    if current is not None and delta is not None:
+        return core.apply_delta(current, delta, store=core.default_store())
+    max_age = float('inf') if initial else config.SNAPSHOT_MAX_AGE
+    return core.load_dataset(store=core.default_store(), max_age=max_age, current=current)
+
+
+def refresher():
+    """
+    (DatasetRefresher, profiler do aquecimento). Na primeira chamada faz a
+    carga inicial e o aquecimento do processo; uma falha sobe para quem chamou
+    e a próxima chamada tenta de novo.
+    """
+    global _refresher
+    with _lock:
+        if _refresher is None:
+            mark_cache(False)
+            cache = result_cache()
+            created = DatasetRefresher(
+                load_dataset, interval=config.REFRESH_INTERVAL,
+                on_swap=lambda swapped: warm_default_view(swapped, cache),
+            )
+            _, profile = warm_up(lambda: created.start().dataset, result_cache=cache)
+            _refresher = (created, profile)
+        return _refresher
+
+
+def boot():
+    """Cria e aquece o estado do processo (chamado por `serve.py` antes do servidor)."""
+    partition_loader()
+    export_cache()
+    return refresher()
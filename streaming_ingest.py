@@ -0,0 +1,187 @@
+"""
+Ingestão em streaming do CSV da planilha, com memória limitada.
+
+O CSV é lido em blocos de tamanho fixo pelo leitor incremental do pyarrow.
+Cada bloco é convertido e tem as métricas derivadas calculadas sozinho, e o
+resultado é copiado para buffers colunares pré-alocados (redimensionados no
+lugar quando a estimativa de linhas fica curta). Assim o pico de memória fica
+perto do tamanho da tabela final, sem as cópias da coluna inteira de
+`process_data` (texto, troca de vírgula, `to_numeric`, `fillna`, `rename`).
+
+Dimensões são acumuladas como códigos de um dicionário global e só viram
+texto (ou categóricas, no modo compacto) no fim. Os valores monetários com
+vírgula decimal são convertidos direto no Arrow, sem passar por objetos
+Python; só um bloco com valor inválido cai no `pd.to_numeric` do pandas.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+from column_mapping import column_mapping
+from schema import DERIVED_COLUMNS, derived_values
+
+BLOCK_SIZE = 16 * 1024 * 1024  # bytes de CSV por bloco
+
+DIMENSION_FIELDS = ['cidade', 'estado', 'nome_universal', 'sku']
+MONEY_FIELDS = ['faturamento', 'faturamento_total_cidade_mes']
+COUNTER_FIELDS = ['unidades_fisicas', 'pedidos', 'total_pedidos_cidade_mes']  # vazio vira 0
+# Como no `read_csv`: sem preenchimento, inteiro se não houver vazios nem casas decimais
+INFERRED_FIELDS = ['quantidade']
+
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+COLUMN_TYPES = {
+    'mes': _DICTIONARY,
+    **{field: _DICTIONARY for field in DIMENSION_FIELDS},
+    **{field: pa.string() for field in MONEY_FIELDS},
+    **{field: pa.float64() for field in COUNTER_FIELDS + INFERRED_FIELDS},
+}
+
+
+def parse_decimal_comma(array):
+    """Texto com vírgula decimal ('1234,56') -> float64; vazio ou inválido vira 0."""
+    dotted = pc.replace_substring(array, ',', '.')
+    try:
+        values = pc.cast(dotted, pa.float64())
+    except pa.ArrowInvalid:
+        values = pa.array(pd.to_numeric(dotted.to_pandas(), errors='coerce'), type=pa.float64())
+    return pc.fill_null(values, 0.0).to_numpy(zero_copy_only=False)
+
+
+def _indices(array):
+    return pc.fill_null(array.indices, -1).to_numpy(zero_copy_only=False)
+
+
+class _Dictionary:
+    """Dicionário global de uma dimensão: valor -> código, na ordem de aparição."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, array):
+        lookup = [self.codes.setdefault(value, len(self.codes)) for value in array.dictionary.to_pylist()]
+        # Último item: destino do índice -1 (valor vazio)
+        lookup = np.array(lookup + [-1], dtype=np.int32)
+        return lookup[_indices(array)]
+
+    def categorical(self, codes):
+        values = pd.Index(list(self.codes), dtype=object)
+        order = values.argsort()
+        # Categorias ordenadas, como em astype('category')
+        remap = np.empty(len(order) + 1, dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
+        remap[-1] = -1
+        return pd.Categorical.from_codes(remap[codes], categories=values[order])
+
+
+def _parse_months(array):
+    months = pd.to_datetime(pd.Series(array.dictionary.to_pylist(), dtype=object), format='%Y-%m', errors='coerce')
+    lookup = np.append(months.to_numpy(dtype='datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return lookup[_indices(array)]
+
+
+class _Buffers:
+    """Colunas pré-alocadas, preenchidas bloco a bloco."""
+
+    def __init__(self, dtypes, capacity):
+        self.capacity = max(int(capacity), 1)
+        self.rows = 0
+        self.columns = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def _resize(self, capacity):
+        # Redimensiona no lugar (realloc): nenhuma view dos buffers fica viva
+        for values in self.columns.values():
+            values.resize(capacity, refcheck=False)
+        self.capacity = capacity
+
+    def append(self, chunk, n):
+        if self.rows + n > self.capacity:
+            self._resize(max(self.rows + n, int(self.capacity * 1.5)))
+        for name, values in chunk.items():
+            self.columns[name][self.rows:self.rows + n] = values
+        self.rows += n
+
+    def finish(self):
+        if self.capacity != self.rows:
+            self._resize(self.rows)
+        return self.columns
+
+
+def _converted(batch, dictionaries):
+    """Colunas de um bloco já convertidas, com os nomes do `column_mapping`."""
+    chunk = {}
+    for field in column_mapping:
+        array = batch.column(field)
+        if field == 'mes':
+            values = _parse_months(array)
+        elif field in DIMENSION_FIELDS:
+            values = dictionaries[field].encode(array)
+        elif field in MONEY_FIELDS:
+            values = parse_decimal_comma(array)
+        elif field in COUNTER_FIELDS:
+            values = pc.fill_null(array, 0.0).to_numpy(zero_copy_only=False)
+        else:
+            values = array.to_numpy(zero_copy_only=False)
+        chunk[column_mapping[field]] = values
+    return chunk
+
+
+def ingest_csv(stream, size_hint=None, compact=False, block_size=BLOCK_SIZE):
+    """
+    Lê e processa o CSV de `stream` em blocos; retorna a mesma tabela que
+    `process_data(parse_raw(...))`. `size_hint` (bytes do CSV) dimensiona os
+    buffers. Com `compact=True` as dimensões já saem categóricas e as métricas
+    derivadas não são calculadas (ver `schema.compact_frame`).
+    """
+    try:
+        reader = pv.open_csv(
+            stream,
+            read_options=pv.ReadOptions(block_size=block_size),
+            convert_options=pv.ConvertOptions(
+                column_types=COLUMN_TYPES,
+                include_columns=list(column_mapping),
+                strings_can_be_null=True,
+            ),
+        )
+    except pa.ArrowInvalid as e:
+        if 'Empty CSV file' in str(e):
+            return pd.DataFrame()
+        raise
+
+    derived = [] if compact else list(DERIVED_COLUMNS)
+    dtypes = {column_mapping[field]: (
+        'datetime64[ns]' if field == 'mes'
+        else np.int32 if field in DIMENSION_FIELDS
+        else np.float64
+    ) for field in column_mapping}
+    dtypes.update({name: np.float64 for name in derived})
+    dictionaries = {field: _Dictionary() for field in DIMENSION_FIELDS}
+
+    buffers = None
+    for batch in reader:
+        if not batch.num_rows:
+            continue
+        chunk = _converted(batch, dictionaries)
+        for name in derived:
+            chunk[name] = derived_values(chunk, name)
+        if buffers is None:
+            # Linhas estimadas pelos bytes por linha do primeiro bloco; se faltar, os buffers crescem
+            blocks = size_hint / block_size if size_hint and size_hint > block_size else 1
+            buffers = _Buffers(dtypes, batch.num_rows * blocks * 1.05)
+        buffers.append(chunk, batch.num_rows)
+    if buffers is None:
+        return pd.DataFrame(columns=list(column_mapping.values()) + derived)
+
+    columns = buffers.finish()
+    for field in DIMENSION_FIELDS:
+        name = column_mapping[field]
+        values = dictionaries[field].categorical(columns[name])
+        columns[name] = values if compact else values.astype(object)
+    for field in INFERRED_FIELDS:
+        name = column_mapping[field]
+        values = columns[name]
+        if not np.isnan(values).any() and np.array_equal(values, np.floor(values)):
+            columns[name] = values.astype(np.int64)
+    # copy=False: cada coluna vira um bloco próprio, sem consolidar (e copiar) a tabela
+    return pd.DataFrame(columns, copy=False)
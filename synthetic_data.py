@@ -0,0 +1,96 @@
+"""
+Gerador de dados sintéticos no layout da planilha, para benchmarks.
+
+Cada cidade-mês recebe um conjunto de produtos distintos com totais da cidade
+coerentes entre as linhas, e os valores monetários usam vírgula decimal como
+na exportação do Google Sheets. A geração é vetorizada e determinística pela
+semente, então 10 mil ou 10 milhões de linhas saem do mesmo código.
+"""
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+STATES = ['SP', 'RJ', 'MG', 'PR', 'SC', 'RS', 'BA', 'GO', 'PE', 'CE', 'PA', 'MA', 'ES', 'PB', 'RN', 'AL',
+          'MT', 'MS', 'DF', 'PI', 'SE', 'RO', 'TO', 'AC', 'AM', 'AP', 'RR']
+
+
+def generate_raw(n_rows, n_cities=None, n_states=8, n_products=None, n_months=24, start='2023-01', seed=0):
+    """
+    DataFrame bruto (colunas do `column_mapping`) com aproximadamente `n_rows`
+    linhas. Sem `n_cities`/`n_products`, as cardinalidades crescem com o volume.
+    """
+    if n_cities is None:
+        n_cities = max(20, int(math.sqrt(n_rows / n_months) * 2))
+    if n_products is None:
+        n_products = max(50, int(math.sqrt(n_rows)))
+    n_states = min(n_states, len(STATES), n_cities)
+
+    rng = np.random.default_rng(seed)
+    cells = n_cities * n_months
+    per_cell = min(n_products, math.ceil(n_rows / cells))
+
+    # Produtos distintos por cidade-mês: deslocamento aleatório sobre uma permutação
+    cell = np.repeat(np.arange(cells), per_cell)[:n_rows]
+    slot = np.tile(np.arange(per_cell), cells)[:n_rows]
+    offset = rng.integers(0, n_products, size=cells)
+    product = rng.permutation(n_products)[(offset[cell] + slot) % n_products]
+
+    month = cell // n_cities
+    city = cell % n_cities
+    months = pd.period_range(start, periods=n_months, freq='M').strftime('%Y-%m').to_numpy()
+
+    n = len(cell)
+    pedidos = rng.integers(1, 50, size=n)
+    faturamento = np.round(rng.uniform(10, 5000, size=n), 2)
+    cell_pedidos = rng.integers(200, 2000, size=cells)
+    cell_faturamento = np.round(rng.uniform(1e4, 1e6, size=cells), 2)
+
+    cidades = np.array([f"Cidade {i:05d}" for i in range(n_cities)], dtype=object)
+    estados = np.array([STATES[i % n_states] for i in range(n_cities)], dtype=object)
+    produtos = np.array([f"Produto {i:05d}" for i in range(n_products)], dtype=object)
+    skus = np.array([f"SKU{i:06d}" for i in range(n_products)], dtype=object)
+
+    return pd.DataFrame({
+        'mes': months[month],
+        'cidade': cidades[city],
+        'estado': estados[city],
+        'nome_universal': produtos[product],
+        'sku': skus[product],
+        'quantidade': pedidos,
+        'unidades_fisicas': pedidos * rng.integers(1, 4, size=n),
+        'pedidos': pedidos,
+        'faturamento': faturamento,
+        'total_pedidos_cidade_mes': cell_pedidos[cell],
+        'faturamento_total_cidade_mes': cell_faturamento[cell],
+    })
+
+
+def write_csv(df, path, chunk_rows=500_000):
+    """Grava no formato da planilha: separador ',' e vírgula decimal (valores entre aspas)."""
+    for start in range(0, len(df), chunk_rows):
+        df.iloc[start:start + chunk_rows].to_csv(
+            path, mode='w' if start == 0 else 'a', header=(start == 0), index=False, decimal=','
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um CSV sintético no layout da planilha.")
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--cities', type=int)
+    parser.add_argument('--states', type=int, default=8)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--start', default='2023-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df = generate_raw(args.rows, args.cities, args.states, args.products, args.months, args.start, args.seed)
+    write_csv(df, args.path)
+    print(f"{len(df)} linhas gravadas em {args.path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Paridade entre os motores de consulta: o DuckDB deve devolver os mesmos KPIs,
+Top-N e comparativos que o motor de referência pandas, nas representações
+normal e compacta, inclusive em seleções vazias e com valores ausentes.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import topcity_core as core
+from aggregates import TOP_DIMENSIONS, TOP_METRICS
+from data_loader import Snapshot, parse_raw, process_data
+from dataset import Dataset
+from query_backend import available_backends
+from schema import compact_frame
+from synthetic_data import generate_raw, write_csv
+
+RTOL = 1e-9
+OTHER_BACKENDS = [
+    pytest.param(name, marks=pytest.mark.skipif(name not in available_backends(), reason=f"{name} não instalado"))
+    for name in ['duckdb']
+]
+
+
+@pytest.fixture(scope='module')
+def processed(tmp_path_factory):
+    raw = generate_raw(4000, n_cities=12, n_states=4, n_products=30, n_months=15, seed=3)
+    # Linhas problemáticas da planilha: dimensão vazia, mês inválido e totais zerados
+    raw.loc[0:4, 'cidade'] = np.nan
+    raw.loc[5:9, 'nome_universal'] = np.nan
+    raw.loc[10:14, 'mes'] = 'invalido'
+    raw.loc[15:29, 'faturamento_total_cidade_mes'] = 0
+    raw.loc[30:44, 'pedidos'] = 0
+    path = tmp_path_factory.mktemp('dados') / 'dados.csv'
+    write_csv(raw, path)
+    return process_data(parse_raw(path.read_bytes()))
+
+
+def make_dataset(frame, compact, backend):
+    if compact:
+        frame, _ = compact_frame(frame)
+    snapshot = Snapshot(frame=frame, fingerprint='paridade', created_at=datetime.now(), source='sintetico',
+                        compact=compact)
+    return Dataset.from_snapshot(snapshot, backend=backend, threads=2)
+
+
+def selections(dataset):
+    catalog = dataset.catalog
+    months = catalog.values('Mês')
+    estados = catalog.values('Estado')
+    cidades = catalog.values('Cidade')
+    produtos = catalog.values('Produto')
+    return {
+        'padrao': core.default_selection(catalog),
+        'tudo': core.Selection(),
+        'estado': core.Selection.of(months[-6:], estados[:1]),
+        'produtos': core.Selection.of(months[-3:], None, None, produtos[:5]),
+        'cidades_produtos': core.Selection.of(months[-2:], None, cidades[:3], produtos[:10]),
+        'sem_linhas': core.Selection.of(months[-1:], ['XX']),
+        'sem_linhas_produtos': core.Selection.of(months[-1:], None, None, ['Produto inexistente']),
+    }
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['normal', 'compacto'])
+def reference(request, processed):
+    return make_dataset(processed.copy(), request.param, 'pandas'), request.param
+
+
+def assert_same_kpis(expected, actual):
+    for field in core.Kpis._fields:
+        assert getattr(actual, field) == pytest.approx(getattr(expected, field), rel=RTOL, nan_ok=True), field
+
+
+def assert_same_frame(expected, actual):
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_exact=False, rtol=RTOL)
+
+
+@pytest.mark.parametrize('backend', OTHER_BACKENDS)
+def test_kpis(reference, processed, backend):
+    dataset, compact = reference
+    other = make_dataset(processed.copy(), compact, backend)
+    for label, selection in selections(dataset).items():
+        assert_same_kpis(core.calculate_kpis(dataset, selection), core.calculate_kpis(other, selection))
+
+
+@pytest.mark.parametrize('backend', OTHER_BACKENDS)
+def test_top_n(reference, processed, backend):
+    dataset, compact = reference
+    other = make_dataset(processed.copy(), compact, backend)
+    for label, selection in selections(dataset).items():
+        expected, actual = core.top_aggregate(dataset, selection), core.top_aggregate(other, selection)
+        for dim in TOP_DIMENSIONS:
+            assert_same_frame(expected.totals(dim), actual.totals(dim))
+            for metric in TOP_METRICS:
+                assert_same_frame(expected.top(dim, metric, 10), actual.top(dim, metric, 10))
+
+
+@pytest.mark.parametrize('backend', OTHER_BACKENDS)
+def test_comparisons(reference, processed, backend):
+    dataset, compact = reference
+    other = make_dataset(processed.copy(), compact, backend)
+    for label, selection in selections(dataset).items():
+        if not selection.months:
+            continue
+        assert_same_frame(core.monthly_base(dataset, selection), core.monthly_base(other, selection))
+        assert_same_frame(core.calculate_comparisons(dataset, selection),
+                          core.calculate_comparisons(other, selection))
+
+
+def test_empty_selection_metrics(reference):
+    """Seleção vazia: somas zeradas e média NaN (o DuckDB devolve NULL, convertido para NaN)."""
+    dataset, _ = reference
+    kpis = core.calculate_kpis(dataset, selections(dataset)['sem_linhas_produtos'])
+    assert kpis.total_faturamento == 0
+    assert kpis.total_unidades_fisicas == 0
+    assert kpis.ticket_medio_geral == 0
+    assert np.isnan(kpis.media_participacao_faturamento)
+    assert core.top_aggregate(dataset, selections(dataset)['sem_linhas']).top('Cidade', TOP_METRICS[0], 10).empty
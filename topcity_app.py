@@ -1,33 +1,19 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
-import numpy as np
-import io
-# Assegure-se de que 'column_mapping.py' esteja na mesma pasta
-from column_mapping import column_mapping
-
-# Helper function for Brazilian currency formatting (dot for thousands, comma for decimals)
-def format_currency_br(value):
-    if pd.isna(value) or value is None:
-        return "R$ 0,00"
-    # Format number with comma as decimal and dot as thousands, then swap them
-    s_value = "{:,.2f}".format(value) # e.g., "1,234,567.89" (US locale default)
-    # The trick: replace comma (US thousands) with a temp char, dot (US decimal) with comma, then temp char with dot
-    s_value = s_value.replace(",", "X").replace(".", ",").replace("X", ".")
-    return f"R$ {s_value}"
-
-# Helper function for Brazilian integer formatting (dot for thousands, no decimals)
-def format_integer_br(value):
-    if pd.isna(value) or value is None:
-        return "0"
-    # Ensure value is treated as an integer before formatting
-    int_value = int(value)
-    s_value = "{:,.0f}".format(int_value) # e.g., "1,000" (US locale default)
-    # The trick: replace comma (US thousands) with a temp char, dot (US decimal) with comma, then temp char with dot
-    s_value = s_value.replace(",", "X").replace(".", ",").replace("X", ".")
-    return s_value
+from datetime import datetime
+from functools import partial
+# Assegure-se de que 'config.py' e 'data_loader.py' estejam na mesma pasta
+import config
+from data_loader import EmptySourceError
+from formatting import format_currency_br, format_frame_br, format_integer_br, style_frame_br
+from exporter import EXPORT_FORMATS, ExportTooLargeError, available_formats, export_frame
+from pagination import PagedView, sort_permutation
+from comparisons import PREVIOUS, YEAR_AGO, describe_months
+from partitions import months_needed
+import server_state
+import topcity_core as core
+from instrumentation import Profiler, activate, section, span
+from approximate import ExactJobs
 
 # Configuração da página
 st.set_page_config(
@@ -43,17 +29,39 @@ if "autenticado" not in st.session_state:
 
 if not st.session_state.autenticado:
     senha_correta = st.secrets["app_password"]
+    # Senha opcional de administração: libera o painel de instrumentação
+    senha_admin = st.secrets.get("admin_password")
     with st.container():
         st.markdown("### 🔐 Acesso Restrito")
         senha = st.text_input("Digite a senha para acessar o dashboard:", type="password")
-        if senha == senha_correta:
+        if senha == senha_correta or (senha_admin and senha == senha_admin):
             st.session_state.autenticado = True
+            st.session_state.admin = bool(senha_admin) and senha == senha_admin
             st.success("✅ Acesso liberado com sucesso!")
             st.rerun()
         elif senha != "":
             st.error("❌ Senha incorreta. Tente novamente.")
     st.stop() 
 
+# Fragmentos reexecutam só a própria seção quando um widget dela muda
+fragment = getattr(st, 'fragment', None) or st.experimental_fragment
+
+# INSTRUMENTAÇÃO: ligada por variável de ambiente ou, para administradores, com ?profile=1
+is_admin = st.session_state.get('admin', False)
+profiling_enabled = config.PROFILING or (is_admin and st.query_params.get('profile') == '1')
+
+def start_profiler(scope):
+    """Profiler de uma execução (script ou fragmento); None com a instrumentação desligada."""
+    if not profiling_enabled:
+        return None
+    profiler = Profiler(scope, log_path=config.PROFILE_LOG, track_memory=config.PROFILE_MEMORY)
+    # Última execução de cada escopo, exibida no painel da sidebar
+    st.session_state.setdefault('profiles', {})[scope] = profiler
+    return profiler
+
+profiler = start_profiler('script')
+activate(profiler)
+
 # CSS personalizado REDUZIDO
 st.markdown("""
 <style>
@@ -75,6 +83,10 @@ st.markdown("""
         font-size: 2.2em;
         font-weight: bold;
     }
+    .metric-error {
+        font-size: 0.9em;
+        opacity: 0.8;
+    }
     .main-header {
         background: linear-gradient(90deg, #96ca00 0%, #4e9f00  100%);
         padding: 2rem;
@@ -102,86 +114,42 @@ st.markdown("""
 # Título Principal do Dashboard
 st.markdown("<h1 class='main-header'>Dashboard de Análise de Produtos e Cidades 🏙️</h1>", unsafe_allow_html=True)
 
-# FUNÇÃO DE CARREGAMENTO OTIMIZADA
-@st.cache_data(ttl=300)  # Cache por 5 minutos
-def load_data():
-    """
-    Carrega e pré-processa os dados da planilha do Google Sheets.
-    """
-    sheet_id = '14Y-V3ezwo3LsHWERhSyURCtkQdN3drzv9F5JNRQnXEc'
-    tab_name = 'Produtos_Cidades_Completas'
-    google_sheet_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={tab_name}"
-
-    try:
-        # Otimização: Especificar tipos de dados para acelerar o carregamento
-        dtype_dict = {
-            'faturamento': 'str',
-            'faturamento_total_cidade_mes': 'str',
-            'unidades_fisicas': 'float64',
-            'pedidos': 'float64',
-            'total_pedidos_cidade_mes': 'float64'
-        }
-        
-        df = pd.read_csv(google_sheet_url, dtype=dtype_dict)
-        
-    except Exception as e:
-        st.error(f"Erro ao carregar dados: {e}")
-        st.stop()
-
-    if df.empty:
-        st.warning("A planilha está vazia.")
-        st.stop()
-
-    # PROCESSAMENTO OTIMIZADO
-    with st.spinner("Processando dados..."):
-        # Conversão de data otimizada
-        df['mes'] = pd.to_datetime(df['mes'], format='%Y-%m', errors='coerce')
-        
-        # Conversão numérica otimizada usando vectorização
-        numeric_columns = ['faturamento', 'faturamento_total_cidade_mes']
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.'), errors='coerce').fillna(0)
-        
-        # Preencher NaN com 0 para colunas numéricas
-        numeric_cols = ['unidades_fisicas', 'pedidos', 'total_pedidos_cidade_mes']
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-
-        # Renomear colunas
-        df = df.rename(columns=column_mapping)
-
-        # Calcular métricas derivadas usando operações vetorizadas
-        df['Participação Faturamento Cidade Mês (%)'] = np.where(
-            df['Faturamento Total da Cidade no Mês'] > 0,
-            (df['Faturamento do Produto'] / df['Faturamento Total da Cidade no Mês']) * 100,
-            0
-        )
+# Estado do processo (caches, carregador particionado e atualização dos dados) fica em
+# `server_state`, compartilhado entre sessões sem cópia. A thread de atualização recarrega
+# a fonte a cada intervalo e troca os dados só depois de validados: as páginas nunca
+# esperam pela planilha após a primeira carga. Com `python serve.py` o aquecimento
+# (importações, carga e agregados da visão padrão) roda antes de o servidor aceitar
+# conexões; com `streamlit run` direto, na primeira sessão
+partition_loader = server_state.partition_loader()
+result_cache = server_state.result_cache()
 
-        df['Participação Pedidos Cidade Mês (%)'] = np.where(
-            df['Total de Pedidos da Cidade no Mês'] > 0,
-            (df['Pedidos com Produto'] / df['Total de Pedidos da Cidade no Mês']) * 100,
-            0
-        )
-
-        df['Ticket Médio do Produto'] = np.where(
-            df['Pedidos com Produto'] > 0,
-            df['Faturamento do Produto'] / df['Pedidos com Produto'],
-            0
-        )
-    
-    return df
-
-# Carregamento com indicador de progresso
+# Carregamento com indicador de progresso (só a primeira carga do processo espera a fonte)
 with st.spinner("Carregando dados do Google Sheets..."):
-    df = load_data()
-
-# OTIMIZAÇÃO: Usar session_state para manter listas de opções
-if 'filter_options' not in st.session_state:
-    st.session_state.filter_options = {
-        'months': sorted(df['Mês'].dt.to_period('M').unique().to_timestamp().tolist()),
-        'estados': sorted(df['Estado'].unique().tolist()),
-        'cidades': sorted(df['Cidade'].unique().tolist()),
-        'produtos': sorted(df['Produto'].unique().tolist())
-    }
+    with span('load_data') as s:
+        s.cache = 'hit'
+        try:
+            refresher, warmup_profile = server_state.refresher()
+        except EmptySourceError:
+            st.warning("A planilha está vazia.")
+            st.stop()
+        except Exception as e:
+            st.error(f"Erro ao carregar dados: {e}")
+            st.stop()
+        dataset = refresher.dataset
+        s.rows = len(dataset.frame)
+
+# OTIMIZAÇÃO: opções dos filtros vêm do catálogo de dimensões do Dataset, compartilhado
+# entre sessões e reconstruído junto com os dados a cada atualização
+catalog = dataset.catalog
+
+# Data dos dados em uso e resultado da última atualização em segundo plano
+refresh_status = refresher.status
+st.sidebar.caption(f"🕒 Dados de {dataset.created_at.strftime('%d/%m/%Y %H:%M')}")
+if refresh_status.ok:
+    st.sidebar.caption(f"Última atualização: {refresh_status.last_attempt.strftime('%H:%M:%S')} ✅")
+else:
+    st.sidebar.caption(f"⚠️ Falha na atualização das {refresh_status.last_attempt.strftime('%H:%M:%S')} "
+                       f"({refresh_status.error}); exibindo os dados anteriores.")
 
 # --- Sidebar para Filtros OTIMIZADA ---
 st.sidebar.header("⚙️ Filtros Globais")
@@ -195,227 +163,229 @@ if st.sidebar.button("🔄 Resetar Filtros"):
     st.rerun()
 
 # Filtros com valores padrão otimizados
-available_months = st.session_state.filter_options['months']
+# Fonte particionada: os meses vêm da lista de partições, carregadas ou não
+available_months = partition_loader.months if partition_loader is not None else catalog.values('Mês')
 selected_months = st.sidebar.multiselect(
     "Selecione o(s) Mês(es)",
     options=available_months,
-    default=st.session_state.get('selected_months', available_months[-3:]),  # Últimos 3 meses por padrão
+    default=st.session_state.get('selected_months', available_months[-core.DEFAULT_MONTHS:]),  # Últimos 3 meses por padrão
     format_func=lambda x: x.strftime('%Y-%m'),
     key='month_filter'
 )
 
+# Partições mais antigas só são lidas quando a seleção (ou seus comparativos) precisar delas
+if partition_loader is not None:
+    needed = months_needed(selected_months)
+    with span('particoes_sob_demanda'):
+        if partition_loader.covers(needed):
+            dataset = partition_loader.dataset
+        else:
+            with st.spinner("Carregando meses anteriores..."):
+                dataset = partition_loader.load(needed)
+    catalog = dataset.catalog
+
 selected_estados = st.sidebar.multiselect(
     "Selecione o(s) Estado(s)",
-    options=st.session_state.filter_options['estados'],
-    default=st.session_state.get('selected_estados', st.session_state.filter_options['estados'][:5]),  # Primeiros 5 estados
+    options=catalog.values('Estado'),
+    default=st.session_state.get('selected_estados', catalog.values('Estado')[:core.DEFAULT_ESTADOS]),  # Primeiros 5 estados
     key='estado_filter'
 )
 
-# Filtro de cidade otimizado
-if selected_estados:
-    available_cidades = sorted(df[df['Estado'].isin(selected_estados)]['Cidade'].unique())
-else:
-    available_cidades = st.session_state.filter_options['cidades']
+# Filtro de cidade em cascata, resolvido na relação estado→cidades do catálogo
+available_cidades = catalog.related('Estado', selected_estados, 'Cidade')
 
 selected_cidades = st.sidebar.multiselect(
     "Selecione a(s) Cidade(s)",
     options=available_cidades,
-    default=st.session_state.get('selected_cidades', available_cidades[:10]),  # Primeiras 10 cidades
+    default=st.session_state.get('selected_cidades', available_cidades[:core.DEFAULT_CIDADES]),  # Primeiras 10 cidades
     key='cidade_filter'
 )
 
 selected_produtos = st.sidebar.multiselect(
     "Selecione o(s) Produto(s)",
-    options=st.session_state.filter_options['produtos'],
+    options=catalog.values('Produto'),
     default=st.session_state.get('selected_produtos', []),
     key='produto_filter'
 )
 
 # APLICAÇÃO DE FILTROS OTIMIZADA
-df_filtrado = df.copy()
-
-# Aplicar filtros em sequência para reduzir o tamanho do DataFrame
-if selected_months:
-    df_filtrado = df_filtrado[df_filtrado['Mês'].isin(selected_months)]
-
-if selected_estados:
-    df_filtrado = df_filtrado[df_filtrado['Estado'].isin(selected_estados)]
-
-if selected_cidades:
-    df_filtrado = df_filtrado[df_filtrado['Cidade'].isin(selected_cidades)]
-
-if selected_produtos:
-    df_filtrado = df_filtrado[df_filtrado['Produto'].isin(selected_produtos)]
-
-if df_filtrado.empty:
+# Índices invertidos construídos no carregamento: sem df.copy() nem isin sobre a tabela inteira
+selection = core.Selection.of(selected_months, selected_estados, selected_cidades, selected_produtos)
+# Só posições: as linhas são copiadas apenas pela página da tabela e pela exportação
+with span('filtro') as s:
+    positions = core.select_positions(dataset, selection)
+    selected_rows = len(dataset.frame) if positions is None else len(positions)
+    s.rows = selected_rows
+
+# Chave barata dos resultados em cache: dispensa o hash do DataFrame filtrado
+signature = selection.signature()
+
+if selected_rows == 0:
     st.warning("Nenhum dado encontrado. Ajuste os filtros.")
     st.stop()
 
+# MODO PROGRESSIVO: em seleções muito grandes os KPIs e o Top-N exatos são calculados
+# em segundo plano; enquanto isso a página mostra estimativas da amostra estratificada
+@st.cache_resource
+def get_exact_jobs():
+    return ExactJobs(result_cache)
+
+kpis_key = ('kpis', dataset.version, signature)
+top_key = ('top', dataset.version, signature)
+pending_exact = []
+if config.PROGRESSIVE and selected_rows >= config.PROGRESSIVE_MIN_ROWS:
+    exact_jobs = get_exact_jobs()
+    exact_jobs.start(kpis_key, partial(core.calculate_kpis, dataset, selection))
+    exact_jobs.start(top_key, partial(core.top_aggregate, dataset, selection))
+    pending_exact = exact_jobs.pending([kpis_key, top_key])
+    if pending_exact:
+        # Sorteada uma vez por versão e guardada no próprio Dataset (não sai do cache)
+        sample = core.stratified_sample(dataset)
+
 # CÁLCULO DE KPIS OTIMIZADO
 st.header("📊 Principais Indicadores")
 
-@st.cache_data
-def calculate_kpis(df_filtered, has_products_selected):
-    if has_products_selected:
-        total_faturamento = df_filtered['Faturamento do Produto'].sum()
-        total_pedidos_kpi = df_filtered['Pedidos com Produto'].sum()
+# Calcular KPIs (estimados enquanto o cálculo exato não termina)
+with span('kpis'):
+    if kpis_key in pending_exact:
+        kpis, kpi_errors = result_cache.get_or_compute(
+            ('kpis_estimativa', dataset.version, signature),
+            lambda: core.estimate_kpis(dataset, sample, selection)
+        )
     else:
-        # Usar groupby mais eficiente
-        df_kpi = df_filtered.drop_duplicates(['Mês', 'Cidade'])[['Mês', 'Cidade', 'Total de Pedidos da Cidade no Mês', 'Faturamento Total da Cidade no Mês']]
-        total_faturamento = df_kpi['Faturamento Total da Cidade no Mês'].sum()
-        total_pedidos_kpi = df_kpi['Total de Pedidos da Cidade no Mês'].sum()
-
-    total_unidades_fisicas = df_filtered['Unidades Compradas'].sum()
-    ticket_medio_geral = total_faturamento / total_pedidos_kpi if total_pedidos_kpi > 0 else 0
-    media_participacao_faturamento = df_filtered['Participação Faturamento Cidade Mês (%)'].mean()
-    
-    return total_faturamento, total_pedidos_kpi, total_unidades_fisicas, ticket_medio_geral, media_participacao_faturamento
-
-# Calcular KPIs
-kpis = calculate_kpis(df_filtrado, bool(selected_produtos))
+        kpis = result_cache.get_or_compute(kpis_key, lambda: core.calculate_kpis(dataset, selection))
+        kpi_errors = None
 total_faturamento, total_pedidos_kpi, total_unidades_fisicas, ticket_medio_geral, media_participacao_faturamento = kpis
 
-# Display KPIs
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
+def kpi_card(title, value, field, formatter=None):
+    """Cartão de KPI; estimativas levam '≈' e, quando há, a margem do intervalo de 95%."""
+    error = None if kpi_errors is None else kpi_errors[field]
+    approx = "≈ " if kpi_errors is not None and error != 0 else ""
+    margin = f'<div class="metric-error">± {formatter(error)} (IC 95%)</div>' if error and formatter else ""
     st.markdown(f"""
     <div class="metric-card">
-        <div class="metric-title">Faturamento Total</div>
-        <div class="metric-value">{format_currency_br(total_faturamento)}</div>
+        <div class="metric-title">{title}</div>
+        <div class="metric-value">{approx}{value}</div>
+        {margin}
     </div>
     """, unsafe_allow_html=True)
+
+# Display KPIs
+col1, col2, col3, col4, col5 = st.columns(5)
+
+with col1:
+    kpi_card("Faturamento Total", format_currency_br(total_faturamento), 'total_faturamento', format_currency_br)
 with col2:
-    st.markdown(f"""
-    <div class="metric-card">
-        <div class="metric-title">Total Pedidos</div>
-        <div class="metric-value">{format_integer_br(total_pedidos_kpi)}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    kpi_card("Total Pedidos", format_integer_br(total_pedidos_kpi), 'total_pedidos', format_integer_br)
 with col3:
-    st.markdown(f"""
-    <div class="metric-card">
-        <div class="metric-title">Unidades Compradas</div>
-        <div class="metric-value">{format_integer_br(total_unidades_fisicas)}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    kpi_card("Unidades Compradas", format_integer_br(total_unidades_fisicas), 'total_unidades_fisicas', format_integer_br)
 with col4:
-    st.markdown(f"""
-    <div class="metric-card">
-        <div class="metric-title">Ticket Médio Geral</div>
-        <div class="metric-value">{format_currency_br(ticket_medio_geral)}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    kpi_card("Ticket Médio Geral", format_currency_br(ticket_medio_geral), 'ticket_medio_geral')
 with col5:
-    st.markdown(f"""
-    <div class="metric-card">
-        <div class="metric-title">% Partic. Faturamento Prod. (Méd.)</div>
-        <div class="metric-value">{media_participacao_faturamento:,.2f}%</div>
-    </div>
-    """, unsafe_allow_html=True)
+    kpi_card("% Partic. Faturamento Prod. (Méd.)", f"{media_participacao_faturamento:,.2f}%", 'media_participacao_faturamento')
+
+if pending_exact:
+    st.caption(f"⏳ Estimativas de uma amostra estratificada por estado e mês ({format_integer_br(len(sample))} "
+               f"de {format_integer_br(len(dataset.frame))} linhas); os valores exatos substituem as "
+               f"estimativas assim que forem calculados.")
+
+# Cidades-mês cujas linhas de produto discordam nos totais usados pelos KPIs
+divergentes = core.divergent_city_months(dataset, selection)
+if not selected_produtos and not divergentes.empty:
+    with st.expander(f"⚠️ {len(divergentes)} cidade(s)-mês com totais divergentes entre produtos"):
+        st.caption("Os KPIs consideram os totais da primeira linha de cada cidade-mês.")
+        st.dataframe(divergentes.reset_index()[['Mês', 'Estado', 'Cidade']], hide_index=True)
 
 st.markdown("---")
 
 # ANÁLISE DE DESEMPENHO OTIMIZADA
 st.header("📈 Análise de Desempenho")
 
-@st.cache_data
-def get_top_data(df_filtered, group_by, metric, n_items):
-    """Função otimizada para calcular top N de qualquer métrica"""
-    return df_filtered.groupby(group_by)[metric].sum().astype(float).nlargest(n_items).reset_index()
-
-tab_produtos, tab_cidades, tab_estados = st.tabs(["Top Produtos", "Top Cidades", "Top Estados"])
-
-with tab_produtos:
-    st.subheader("Top Produtos por Métrica")
-    metric_produto = st.selectbox(
-        "Selecionar Métrica:",
-        options=["Faturamento do Produto", "Unidades Compradas"],
-        key='metric_produto_tab'
-    )
-    n_produtos = st.slider("Número de Produtos:", min_value=5, max_value=20, value=10, key='n_produtos_tab')
-
-    top_produtos = get_top_data(df_filtrado, 'Produto', metric_produto, n_produtos)
-    top_produtos.columns = ['Produto', 'Total']
+# Uma agregação por estado dos filtros cobre todas as métricas das três abas;
+# trocar a métrica ou o N é só uma seleção parcial sobre os totais
+with span('top_agregado'):
+    if top_key in pending_exact:
+        top_aggregate = result_cache.get_or_compute(
+            ('top_estimativa', dataset.version, signature),
+            lambda: core.estimate_top(sample, selection)
+        )
+    else:
+        top_aggregate = result_cache.get_or_compute(top_key, lambda: core.top_aggregate(dataset, selection))
 
-    # Gráfico otimizado
-    fig_top_produtos = px.bar(
-        top_produtos,
-        x='Total',
-        y='Produto',
-        orientation='h',
-        title=f"Top {n_produtos} Produtos por {metric_produto}",
-        color='Total',
-        color_continuous_scale='Plasma'
-    )
-    
-    fig_top_produtos.update_layout(
-        yaxis={'categoryorder': 'total ascending'},
-        showlegend=False
-    )
-    
-    if metric_produto == "Faturamento do Produto":
-        fig_top_produtos.update_xaxes(tickprefix="R$ ", tickformat=",.0f")
-    
-    st.plotly_chart(fig_top_produtos, use_container_width=True)
-
-with tab_cidades:
-    st.subheader("Top Cidades por Métrica")
-    metric_cidade = st.selectbox(
-        "Selecionar Métrica:",
-        options=["Faturamento do Produto", "Unidades Compradas", "Pedidos com Produto"],
-        key='metric_cidade_tab'
-    )
-    n_cidades = st.slider("Número de Cidades:", min_value=5, max_value=20, value=10, key='n_cidades_tab')
+# Configuração de cada aba: dimensão, rótulo, métricas, N máximo e escala de cores
+TOP_TABS = {
+    "Top Produtos": ('Produto', 'Produtos', ["Faturamento do Produto", "Unidades Compradas"], 20, 'Plasma', 'produtos'),
+    "Top Cidades": ('Cidade', 'Cidades', ["Faturamento do Produto", "Unidades Compradas", "Pedidos com Produto"], 20, 'Viridis', 'cidades'),
+    "Top Estados": ('Estado', 'Estados', ["Faturamento do Produto", "Unidades Compradas", "Pedidos com Produto"], 15, 'Cividis', 'estados'),
+}
 
-    top_cidades = get_top_data(df_filtrado, 'Cidade', metric_cidade, n_cidades)
-    top_cidades.columns = ['Cidade', 'Total']
+def build_top_figure(top_data, dim, label, metric, n_items, color_scale):
+    # Import adiado: o plotly só é carregado quando um gráfico é desenhado (ou no aquecimento)
+    import plotly.express as px
 
-    fig_top_cidades = px.bar(
-        top_cidades,
+    # Top-N estimado: barras com o intervalo de 95% e a confiança de ranking no hover
+    estimated = 'Erro' in top_data.columns
+    fig = px.bar(
+        top_data,
         x='Total',
-        y='Cidade',
+        y=dim,
         orientation='h',
-        title=f"Top {n_cidades} Cidades por {metric_cidade}",
+        title=f"Top {n_items} {label} por {metric}" + (" (estimativa)" if estimated else ""),
         color='Total',
-        color_continuous_scale='Viridis'
+        color_continuous_scale=color_scale,
+        error_x='Erro' if estimated else None,
+        hover_data={'Confiança': ':.0%'} if estimated else None,
     )
     
-    fig_top_cidades.update_layout(
+    fig.update_layout(
         yaxis={'categoryorder': 'total ascending'},
         showlegend=False
     )
     
-    st.plotly_chart(fig_top_cidades, use_container_width=True)
-
-with tab_estados:
-    st.subheader("Top Estados por Métrica")
-    metric_estado = st.selectbox(
-        "Selecionar Métrica:",
-        options=["Faturamento do Produto", "Unidades Compradas", "Pedidos com Produto"],
-        key='metric_estado_tab'
-    )
-    n_estados = st.slider("Número de Estados:", min_value=5, max_value=15, value=10, key='n_estados_tab')
+    if dim == 'Produto' and metric == "Faturamento do Produto":
+        fig.update_xaxes(tickprefix="R$ ", tickformat=",.0f")
+    return fig
+
+def render_top_tab(tab_name, top_aggregate, version, signature):
+    dim, label, metrics, max_n, color_scale, key = TOP_TABS[tab_name]
+    st.subheader(f"{tab_name} por Métrica")
+    # Abas ocultas não existem no modo sob demanda; as escolhas ficam guardadas fora dos widgets
+    saved = st.session_state.setdefault(f'top_{key}_saved', (metrics[0], 10))
+    metric = st.selectbox("Selecionar Métrica:", options=metrics, index=metrics.index(saved[0]), key=f'metric_{key}_tab')
+    n_items = st.slider(f"Número de {label}:", min_value=5, max_value=max_n, value=saved[1], key=f'n_{key}_tab')
+    st.session_state[f'top_{key}_saved'] = (metric, n_items)
+
+    # A figura só é reconstruída quando as entradas desta aba mudam
+    with span(f'top_figura_{key}'):
+        estimated = getattr(top_aggregate, 'approximate', False)
+        fig = result_cache.get_or_compute(
+            ('top_figure', version, signature, dim, metric, n_items, estimated),
+            lambda: build_top_figure(top_aggregate.top(dim, metric, n_items), dim, label, metric, n_items, color_scale)
+        )
+    with span(f'plotly_{key}'):
+        st.plotly_chart(fig, use_container_width=True)
+    if estimated:
+        confidence = top_aggregate.top(dim, metric, n_items)['Confiança']
+        st.caption(f"Confiança no ranking: {confidence.min():.0%} no item menos seguro "
+                   f"(probabilidade de estar à frente do primeiro item fora do Top {n_items}).")
+
+@fragment
+def render_performance_section(top_aggregate, version, signature):
+    with section('desempenho', start_profiler):
+        render_performance_tabs(top_aggregate, version, signature)
+
+def render_performance_tabs(top_aggregate, version, signature):
+    if config.LAZY_RENDERING:
+        # Só a aba visível é calculada e desenhada; widgets da aba reexecutam apenas este fragmento
+        tab_name = st.radio("Visualização", list(TOP_TABS), horizontal=True,
+                            label_visibility="collapsed", key='top_tab')
+        render_top_tab(tab_name, top_aggregate, version, signature)
+    else:
+        for tab, tab_name in zip(st.tabs(list(TOP_TABS)), TOP_TABS):
+            with tab:
+                render_top_tab(tab_name, top_aggregate, version, signature)
 
-    top_estados = get_top_data(df_filtrado, 'Estado', metric_estado, n_estados)
-    top_estados.columns = ['Estado', 'Total']
-
-    fig_top_estados = px.bar(
-        top_estados,
-        x='Total',
-        y='Estado',
-        orientation='h',
-        title=f"Top {n_estados} Estados por {metric_estado}",
-        color='Total',
-        color_continuous_scale='Cividis'
-    )
-    
-    fig_top_estados.update_layout(
-        yaxis={'categoryorder': 'total ascending'},
-        showlegend=False
-    )
-    
-    st.plotly_chart(fig_top_estados, use_container_width=True)
+render_performance_section(top_aggregate, dataset.version, signature)
 
 st.markdown("---")
 
@@ -423,115 +393,163 @@ st.markdown("---")
 st.header("🔄 Comparativos de Período")
 
 if selected_months and len(selected_months) > 0:
-    @st.cache_data
-    def calculate_comparisons(df_base, selected_months, selected_cidades, selected_estados, selected_produtos):
-        # Aplicar filtros base
-        df_comp = df_base.copy()
-        if selected_cidades:
-            df_comp = df_comp[df_comp['Cidade'].isin(selected_cidades)]
-        if selected_estados:
-            df_comp = df_comp[df_comp['Estado'].isin(selected_estados)]
-        
-        min_month = min(selected_months)
-        max_month = max(selected_months)
-        
-        # Período atual
-        current_period = df_comp[
-            (df_comp['Mês'] >= min_month) & (df_comp['Mês'] <= max_month)
-        ]
-        
-        # Período anterior
-        previous_month_start = min_month - pd.DateOffset(months=1)
-        previous_month_end = min_month - pd.DateOffset(days=1)
-        previous_period = df_comp[
-            (df_comp['Mês'] >= previous_month_start) & (df_comp['Mês'] <= previous_month_end)
-        ]
-        
-        if selected_produtos:
-            current_period = current_period[current_period['Produto'].isin(selected_produtos)]
-            previous_period = previous_period[previous_period['Produto'].isin(selected_produtos)]
-            
-            current_fat = current_period['Faturamento do Produto'].sum()
-            current_ped = current_period['Pedidos com Produto'].sum()
-            prev_fat = previous_period['Faturamento do Produto'].sum()
-            prev_ped = previous_period['Pedidos com Produto'].sum()
-        else:
-            current_unique = current_period.drop_duplicates(['Mês', 'Cidade'])
-            prev_unique = previous_period.drop_duplicates(['Mês', 'Cidade'])
-            
-            current_fat = current_unique['Faturamento Total da Cidade no Mês'].sum()
-            current_ped = current_unique['Total de Pedidos da Cidade no Mês'].sum()
-            prev_fat = prev_unique['Faturamento Total da Cidade no Mês'].sum()
-            prev_ped = prev_unique['Total de Pedidos da Cidade no Mês'].sum()
-        
-        return current_fat, current_ped, prev_fat, prev_ped
-    
-    current_fat, current_ped, prev_fat, prev_ped = calculate_comparisons(
-        df, selected_months, selected_cidades, selected_estados, selected_produtos
-    )
+    # Agregado mensal independe dos meses selecionados: trocar meses não refaz a varredura
+    with span('agregado_mensal'):
+        monthly = result_cache.get_or_compute(
+            ('monthly', dataset.version, core.Selection.of(None, selected_estados, selected_cidades, selected_produtos).signature()),
+            lambda: core.monthly_base(dataset, selection)
+        )
+    with span('comparativos'):
+        comparativos = result_cache.get_or_compute(
+            ('comparisons', dataset.version, signature),
+            lambda: core.calculate_comparisons(dataset, selection, monthly)
+        )
     
-    # Calcular variações
-    fat_diff = current_fat - prev_fat
-    fat_perc = (fat_diff / prev_fat * 100) if prev_fat > 0 else 0
-    ped_diff = current_ped - prev_ped
-    ped_perc = (ped_diff / prev_ped * 100) if prev_ped > 0 else 0
+    def render_comparison(comparison):
+        rows = comparativos[comparativos['Comparação'] == comparison].set_index('Métrica')
+        st.caption(f"Referência: {describe_months(rows['Meses de Referência'].iloc[0])}")
+        for metric, formatter in (('Faturamento', format_currency_br), ('Pedidos', format_integer_br)):
+            row = rows.loc[metric]
+            perc = "n/d" if pd.isna(row['Variação (%)']) else f"{row['Variação (%)']:.1f}%"
+            st.metric(metric, formatter(row['Atual']),
+                      delta=f"{formatter(row['Variação'])} ({perc})")
     
     col1, col2 = st.columns(2)
     
     with col1:
         st.subheader("vs. Período Anterior")
-        st.metric("Faturamento", format_currency_br(current_fat), 
-                 delta=f"{format_currency_br(fat_diff)} ({fat_perc:.1f}%)")
-        st.metric("Pedidos", format_integer_br(current_ped), 
-                 delta=f"{format_integer_br(ped_diff)} ({ped_perc:.1f}%)")
+        render_comparison(PREVIOUS)
+    
+    with col2:
+        st.subheader("vs. Mesmo Período do Ano Anterior")
+        render_comparison(YEAR_AGO)
 
 st.markdown("---")
 
 # TABELA DETALHADA OTIMIZADA
 st.header("📋 Dados Detalhados")
 
-# Limitar número de linhas exibidas para melhor performance
-max_rows = st.selectbox("Máximo de linhas:", [100, 500, 1000, 5000], index=1)
-
-# Colunas essenciais para exibição
-display_columns = [
-    'Mês', 'Cidade', 'Estado', 'Produto', 'Unidades Compradas',
-    'Pedidos com Produto', 'Faturamento do Produto'
-]
-
-# Ordenação
-sort_options = {
-    'Faturamento do Produto': 'Faturamento do Produto',
-    'Unidades Compradas': 'Unidades Compradas',
-    'Pedidos com Produto': 'Pedidos com Produto',
-    'Mês': 'Mês'
-}
-
-sort_column = st.selectbox("Ordenar por:", list(sort_options.keys()))
-sort_order = st.radio("Ordem:", ["Decrescente", "Crescente"], index=0)
-ascending = sort_order == "Crescente"
-
-# Aplicar ordenação e limitar linhas
-df_display = df_filtrado.nlargest(max_rows, sort_options[sort_column]) if not ascending else df_filtrado.nsmallest(max_rows, sort_options[sort_column])
-df_display = df_display[display_columns].copy()
-
-# Formatação otimizada
-df_display['Mês'] = df_display['Mês'].dt.strftime('%Y-%m')
-df_display['Faturamento do Produto'] = df_display['Faturamento do Produto'].apply(format_currency_br)
-df_display['Unidades Compradas'] = df_display['Unidades Compradas'].apply(format_integer_br)
-df_display['Pedidos com Produto'] = df_display['Pedidos com Produto'].apply(format_integer_br)
+@fragment
+def render_detail_table(dataset, positions, signature):
+    with section('tabela', start_profiler):
+        render_detail_page(dataset, positions, signature)
+
+def render_detail_page(dataset, positions, signature):
+    # Colunas essenciais para exibição
+    display_columns = [
+        'Mês', 'Cidade', 'Estado', 'Produto', 'Unidades Compradas',
+        'Pedidos com Produto', 'Faturamento do Produto'
+    ]
+
+    # Ordenação por uma ou mais colunas (estável: empates mantêm a ordem original)
+    sort_options = [
+        'Faturamento do Produto', 'Unidades Compradas', 'Pedidos com Produto',
+        'Mês', 'Estado', 'Cidade', 'Produto'
+    ]
+
+    col_sort, col_order, col_size = st.columns([3, 1, 1])
+    with col_sort:
+        sort_columns = st.multiselect("Ordenar por:", sort_options, default=['Faturamento do Produto'])
+    with col_order:
+        sort_order = st.radio("Ordem:", ["Decrescente", "Crescente"], index=0)
+    with col_size:
+        page_size = st.selectbox("Linhas por página:", [100, 500, 1000, 5000], index=1)
+    ascending = sort_order == "Crescente"
+    sort_keys = tuple((col, ascending) for col in sort_columns)
+
+    # A permutação de ordenação fica em cache por filtro e chaves; cada página é só uma fatia dela
+    with span('ordenacao') as s:
+        order = result_cache.get_or_compute(
+            ('sort', dataset.version, signature, sort_keys),
+            lambda: sort_permutation(dataset.frame, sort_keys, positions)
+        )
+        s.rows = len(order)
+    view = PagedView(dataset.frame, order, positions)
+
+    n_pages = view.page_count(page_size)
+    if st.session_state.get('detail_page', 1) > n_pages:
+        st.session_state['detail_page'] = 1
+    page = st.number_input(f"Página (de {format_integer_br(n_pages)}):", min_value=1, max_value=n_pages,
+                           step=1, key='detail_page')
+    start, end = view.page_bounds(page, page_size)
+    st.caption(f"Mostrando linhas {format_integer_br(start + 1)}–{format_integer_br(end)} "
+               f"de {format_integer_br(view.total_rows)}")
+
+    # Formatação otimizada: só a página exibida é formatada; colunas numéricas
+    # formatadas na renderização ou convertidas para texto de uma vez
+    df_display = view.page(page, page_size, display_columns)
+    with span('tabela_renderizacao') as s:
+        s.rows = len(df_display)
+        if config.TABLE_FORMAT == "numeric":
+            st.dataframe(style_frame_br(df_display), use_container_width=True, hide_index=True)
+        else:
+            st.dataframe(format_frame_br(df_display), use_container_width=True, hide_index=True)
 
-st.dataframe(df_display, use_container_width=True, hide_index=True)
+render_detail_table(dataset, positions, signature)
 
 # DOWNLOAD OTIMIZADO
 st.header("📥 Export de Dados")
 
-if st.button("📥 Preparar Download"):
-    with st.spinner("Preparando arquivo..."):
-        csv_data = df_filtrado.to_csv(index=False).encode('utf-8')
+@fragment
+def render_export_section(dataset, positions, signature):
+    with section('exportacao', start_profiler):
+        render_export_controls(dataset, positions, signature)
+
+def render_export_controls(dataset, positions, signature):
+    formats = available_formats()
+    fmt = st.selectbox("Formato:", formats, format_func=lambda f: EXPORT_FORMATS[f][0], key='export_format')
+
+    if st.button("📥 Preparar Download"):
+        with st.spinner("Preparando arquivo..."):
+            # O arquivo gerado fica em cache pela assinatura dos filtros: repetir o clique é grátis
+            try:
+                with span('arquivo_exportacao') as s:
+                    artifact = server_state.export_cache().get_or_compute(
+                        ('export', dataset.version, signature, fmt),
+                        lambda: export_frame(dataset.take(positions), fmt)
+                    )
+                    s.rows = len(dataset.frame) if positions is None else len(positions)
+            except ExportTooLargeError as e:
+                st.warning(f"{e}. Escolha outro formato ou refine os filtros.")
+                return
+        # O download_button do Streamlit 1.35 não faz streaming: recebe o conteúdo inteiro
+        # e o guarda no gerenciador de mídia da sessão até a próxima execução. O arquivo só
+        # é lido aqui, depois do clique em "Preparar Download", e nunca fica em bytes no cache
         st.download_button(
-            label="📥 Download CSV",
-            data=csv_data,
-            file_name=f"dados_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-            mime="text/csv"
-        )
\ No newline at end of file
+            label=f"📥 Download {EXPORT_FORMATS[fmt][0]}",
+            data=artifact.read(),
+            file_name=f"dados_{datetime.now().strftime('%Y%m%d_%H%M')}.{artifact.extension}",
+            mime=artifact.mime
+        )
+
+render_export_section(dataset, positions, signature)
+
+# Estatísticas do cache de resultados compartilhado entre sessões
+with st.sidebar.expander("📦 Cache de resultados"):
+    cache_stats = result_cache.stats()
+    st.caption(f"Acertos: {cache_stats['hits']} · Falhas: {cache_stats['misses']} · Remoções: {cache_stats['evictions']}")
+    st.caption(f"Entradas: {cache_stats['entries']} · {cache_stats['bytes'] / 1024 / 1024:.1f} MB · Taxa de acerto: {cache_stats['hit_rate']:.0%}")
+
+# Com estimativas na tela, verifica a cada segundo se os valores exatos ficaram prontos;
+# a página continua interativa enquanto isso e é reexecutada quando eles chegam
+if pending_exact:
+    @fragment(run_every=1)
+    def wait_exact_results(keys):
+        if not get_exact_jobs().pending(keys):
+            st.rerun()
+
+    wait_exact_results(pending_exact)
+
+# Painel de instrumentação: só para administradores, com a instrumentação ligada
+if profiler is not None:
+    profiler.finish()
+    if is_admin:
+        with st.sidebar.expander("⏱️ Instrumentação"):
+            profiles = {**st.session_state.get('profiles', {}), 'aquecimento do processo': warmup_profile}
+            scope = st.selectbox("Execução:", list(profiles), key='profile_scope')
+            shown = profiles[scope]
+            st.caption(f"{shown.started_at.strftime('%H:%M:%S')} · {shown.duration_ms or 0:,.0f} ms · log em {config.PROFILE_LOG}")
+            if shown.records:
+                records = pd.DataFrame(shown.records).sort_values('inicio_ms')
+                records['etapa'] = ['  ' * level + name for level, name in zip(records['nivel'], records['etapa'])]
+                st.dataframe(records.drop(columns=['nivel', 'erro']), hide_index=True, use_container_width=True)
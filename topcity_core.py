@@ -0,0 +1,232 @@
+"""
+API Python do dashboard, sem dependência do Streamlit.
+
+Reúne carregamento, filtros, KPIs, Top-N, comparativos e exportação para uso
+pelo app, por scripts e pelos benchmarks:
+
+    dataset = load_dataset(CsvFileSource("dados.csv"))
+    selection = Selection.of(estados=["SP"])
+    kpis = calculate_kpis(dataset, selection)
+"""
+from collections import namedtuple
+from dataclasses import dataclass
+
+import config
+from approximate import ApproximateTopN
+from aggregates import DIVERGENT_COLUMN, TopNAggregate, city_month_totals, select_city_months
+from comparisons import compare_periods, monthly_totals
+from data_loader import CsvFileSource, GoogleSheetSource, SnapshotStore, build_source, load_snapshot
+from delta_ingest import apply_delta as apply_delta_snapshot
+from dataset import Dataset
+from exporter import export_frame
+from result_cache import filter_signature
+
+# Visão padrão da sidebar: últimos meses, primeiros estados e primeiras cidades deles
+DEFAULT_MONTHS = 3
+DEFAULT_ESTADOS = 5
+DEFAULT_CIDADES = 10
+
+Kpis = namedtuple('Kpis', [
+    'total_faturamento', 'total_pedidos', 'total_unidades_fisicas',
+    'ticket_medio_geral', 'media_participacao_faturamento',
+])
+
+
+@dataclass(frozen=True)
+class Selection:
+    """Filtros da sidebar; tuplas vazias não filtram a dimensão."""
+    months: tuple = ()
+    estados: tuple = ()
+    cidades: tuple = ()
+    produtos: tuple = ()
+
+    @classmethod
+    def of(cls, months=None, estados=None, cidades=None, produtos=None):
+        def as_tuple(values):
+            return () if values is None else tuple(values)
+        return cls(as_tuple(months), as_tuple(estados), as_tuple(cidades), as_tuple(produtos))
+
+    def signature(self):
+        return filter_signature(self.months, self.estados, self.cidades, self.produtos)
+
+    def as_dict(self):
+        """Seleção {dimensão: valores} usada pelo índice de filtros e pelos motores de consulta."""
+        return {'Mês': self.months, 'Estado': self.estados, 'Cidade': self.cidades, 'Produto': self.produtos}
+
+
+def default_selection(catalog, available_months=None):
+    """Seleção inicial do dashboard, antes de qualquer filtro do usuário."""
+    if available_months is None:
+        available_months = catalog.values('Mês')
+    estados = catalog.values('Estado')[:DEFAULT_ESTADOS]
+    cidades = catalog.related('Estado', estados, 'Cidade')[:DEFAULT_CIDADES]
+    return Selection.of(available_months[-DEFAULT_MONTHS:], estados, cidades)
+
+
+def load_dataset(source=None, store=None, max_age=0, compact=None, backend=None, current=None):
+    """
+    Carrega o Dataset da fonte (padrão: a configurada em `config`), usando o
+    cache de snapshots quando `store` é informado. Se a fonte ainda tiver o
+    fingerprint do snapshot de `current`, devolve `current` sem reler o cache
+    nem reconstruir os índices.
+    """
+    if source is None:
+        source = build_source(config.DATA_SOURCE, config.SHEET_ID, config.TAB_NAME)
+    if compact is None:
+        compact = config.COMPACT_SCHEMA
+    if backend is None:
+        backend = config.QUERY_BACKEND
+    snapshot = load_snapshot(source, store, max_age=max_age, compact=compact,
+                             current=current.snapshot if current is not None else None)
+    if current is not None and current.version == snapshot.version:
+        return current
+    return Dataset.from_snapshot(snapshot, backend=backend, threads=config.QUERY_THREADS)
+
+
+def partitioned_loader(store=None):
+    """Carregador da fonte particionada configurada (diretório de CSVs ou abas), ou None."""
+    from partitions import PartitionedLoader, csv_partitions, sheet_partitions
+
+    if config.PARTITION_DIR:
+        partitions = csv_partitions(config.PARTITION_DIR)
+    elif config.PARTITION_TABS:
+        partitions = sheet_partitions(config.SHEET_ID, config.PARTITION_TABS)
+    else:
+        return None
+    return PartitionedLoader(
+        partitions, store=store, compact=config.COMPACT_SCHEMA, backend=config.QUERY_BACKEND,
+        threads=config.QUERY_THREADS, workers=config.PARTITION_WORKERS, retries=config.PARTITION_RETRIES,
+    )
+
+
+def delta_source():
+    """Fonte de delta configurada (CSV local ou aba da planilha), ou None."""
+    if config.DELTA_SOURCE:
+        return CsvFileSource(config.DELTA_SOURCE)
+    if config.DELTA_TAB_NAME:
+        return GoogleSheetSource(config.SHEET_ID, config.DELTA_TAB_NAME)
+    return None
+
+
+def apply_delta(dataset, source, store=None):
+    """
+    Mescla as linhas da fonte de delta ao Dataset (upsert por Mês, Estado,
+    Cidade e SKU). Devolve o próprio `dataset` quando não há nada novo.
+    """
+    snapshot, report = apply_delta_snapshot(dataset.snapshot, source, store)
+    if report is None:
+        return dataset
+    return dataset.with_delta(snapshot, report.city_months, threads=config.QUERY_THREADS)
+
+
+def default_store():
+    return SnapshotStore(config.SNAPSHOT_DIR, keep=config.SNAPSHOT_KEEP)
+
+
+def select_positions(dataset, selection):
+    """Posições das linhas selecionadas (None = todas)."""
+    return dataset.select(selection.months, selection.estados, selection.cidades, selection.produtos)
+
+
+def filter_rows(dataset, selection):
+    return dataset.take(select_positions(dataset, selection))
+
+
+def selected_city_months(dataset, selection):
+    return select_city_months(dataset.city_month, selection.months, selection.estados, selection.cidades)
+
+
+def divergent_city_months(dataset, selection):
+    """Cidades-mês da seleção cujas linhas de produto discordam nos totais."""
+    city_month = selected_city_months(dataset, selection)
+    return city_month[city_month[DIVERGENT_COLUMN]]
+
+
+def calculate_kpis(dataset, selection):
+    """KPIs da seleção, agregados no motor de consulta do dataset."""
+    sums = ['Unidades Compradas']
+    if selection.produtos:
+        sums += ['Faturamento do Produto', 'Pedidos com Produto']
+    participacao = 'Participação Faturamento Cidade Mês (%)'
+    totals = dataset.backend.aggregate(selection.as_dict(), sums=sums, means=[participacao])
+
+    if selection.produtos:
+        total_faturamento = totals['Faturamento do Produto']
+        total_pedidos = totals['Pedidos com Produto']
+    else:
+        # Totais da cidade vêm da tabela cidade-mês pré-calculada
+        total_faturamento, total_pedidos = city_month_totals(selected_city_months(dataset, selection))
+
+    total_unidades_fisicas = totals['Unidades Compradas']
+    ticket_medio_geral = total_faturamento / total_pedidos if total_pedidos > 0 else 0
+    media_participacao_faturamento = totals[participacao]
+
+    return Kpis(total_faturamento, total_pedidos, total_unidades_fisicas,
+                ticket_medio_geral, media_participacao_faturamento)
+
+
+def stratified_sample(dataset):
+    """Amostra estratificada por estado x mês usada nas estimativas do modo progressivo."""
+    return dataset.stratified_sample(config.PROGRESSIVE_SAMPLE_FRACTION, config.PROGRESSIVE_MIN_PER_STRATUM)
+
+
+def estimate_kpis(dataset, sample, selection):
+    """
+    (Kpis, {campo: meia-largura do intervalo de 95%}) estimados pela amostra;
+    erro 0 indica valor exato e None, estimativa sem intervalo. Sem produto
+    selecionado, faturamento e pedidos vêm exatos da tabela cidade-mês, que
+    já é pequena.
+    """
+    sums = ['Unidades Compradas']
+    if selection.produtos:
+        sums += ['Faturamento do Produto', 'Pedidos com Produto']
+    estimates = sample.estimate_sums(selection.as_dict(), sums)
+
+    if selection.produtos:
+        faturamento, pedidos = estimates['Faturamento do Produto'], estimates['Pedidos com Produto']
+        total_faturamento, total_pedidos = faturamento.value, pedidos.value
+        errors = {'total_faturamento': faturamento.error, 'total_pedidos': pedidos.error, 'ticket_medio_geral': None}
+    else:
+        total_faturamento, total_pedidos = city_month_totals(selected_city_months(dataset, selection))
+        errors = {'total_faturamento': 0.0, 'total_pedidos': 0.0, 'ticket_medio_geral': 0.0}
+    errors['total_unidades_fisicas'] = estimates['Unidades Compradas'].error
+    errors['media_participacao_faturamento'] = None
+
+    kpis = Kpis(
+        total_faturamento, total_pedidos, estimates['Unidades Compradas'].value,
+        total_faturamento / total_pedidos if total_pedidos > 0 else 0,
+        sample.estimate_mean(selection.as_dict(), 'Participação Faturamento Cidade Mês (%)'),
+    )
+    return kpis, errors
+
+
+def estimate_top(sample, selection):
+    """Top-N estimado pela amostra, com erro e confiança de ranking por item."""
+    return ApproximateTopN(sample, selection.as_dict())
+
+
+def top_aggregate(dataset, selection):
+    return TopNAggregate(dataset.backend, selection.as_dict())
+
+
+def get_top_data(dataset, selection, group_by, metric, n_items):
+    """Top N de `group_by` pela métrica: DataFrame [group_by, 'Total']."""
+    return top_aggregate(dataset, selection).top(group_by, metric, n_items)
+
+
+def monthly_base(dataset, selection):
+    """Agregado mensal da seleção, sem o filtro de meses (base dos comparativos)."""
+    return monthly_totals(dataset, selection.estados, selection.cidades, selection.produtos)
+
+
+def calculate_comparisons(dataset, selection, monthly=None):
+    """Frame tidy de comparativos dos meses selecionados (exige ao menos um mês)."""
+    if monthly is None:
+        monthly = monthly_base(dataset, selection)
+    return compare_periods(monthly, selection.months)
+
+
+def export_selection(dataset, selection, fmt, rows=None):
+    if rows is None:
+        rows = filter_rows(dataset, selection)
+    return export_frame(rows, fmt)
@@ -0,0 +1,131 @@
+"""
+Aquecimento do processo: importações, dados e visão padrão prontos uma vez por processo.
+
+Importa os módulos pesados, carrega o snapshot dos dados (com índices e
+catálogo de dimensões) e calcula os agregados da visão padrão do dashboard
+(KPIs, Top-N e comparativos), registrando o tempo de cada etapa num
+`Profiler` da instrumentação.
+
+Com `python serve.py` roda no próprio processo do servidor antes de ele aceitar
+conexões (ver `server_state.boot`): a instância só fica pronta no health check
+depois de aquecida e a primeira sessão já encontra tudo em memória. Com
+`streamlit run topcity_app.py` direto, o Streamlit só executa o script quando a
+primeira sessão se conecta, e quem abre a primeira página paga o aquecimento.
+
+Na linha de comando (`python warmup.py`) só prepara o snapshot em disco, num
+processo separado, e imprime o detalhamento de cada etapa.
+"""
+import argparse
+import importlib
+import json
+import logging
+import sys
+
+import config
+from instrumentation import Profiler, activate, active_profiler, span
+
+logger = logging.getLogger(__name__)
+
+# Módulos pesados importados no aquecimento. O app adia o import do plotly até o
+# primeiro gráfico; importá-lo aqui tira esse custo do primeiro gráfico das sessões
+HEAVY_MODULES = ['numpy', 'pandas', 'pyarrow', 'plotly.express']
+
+
+def import_modules(modules=HEAVY_MODULES):
+    """Importa os módulos, um por etapa; módulos ausentes são ignorados."""
+    for name in modules:
+        with span(f'importacao_{name}') as s:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                s.cache = 'ausente'
+
+
+def warm_default_view(dataset, result_cache=None):
+    """
+    Calcula os agregados da visão padrão do dashboard. Com `result_cache`, os
+    resultados ficam guardados com as mesmas chaves usadas pelo app; a
+    amostra estratificada do modo progressivo fica guardada no Dataset.
+    """
+    import topcity_core as core
+
+    selection = core.default_selection(dataset.catalog)
+    signature = selection.signature()
+    monthly_signature = core.Selection.of(None, selection.estados, selection.cidades, selection.produtos).signature()
+
+    def compute(key, fn):
+        if result_cache is None:
+            return fn()
+        return result_cache.get_or_compute(key, fn)
+
+    with span('kpis'):
+        compute(('kpis', dataset.version, signature), lambda: core.calculate_kpis(dataset, selection))
+    with span('top_n'):
+        compute(('top', dataset.version, signature), lambda: core.top_aggregate(dataset, selection))
+    if selection.months:
+        with span('agregado_mensal'):
+            monthly = compute(('monthly', dataset.version, monthly_signature),
+                              lambda: core.monthly_base(dataset, selection))
+        with span('comparativos'):
+            compute(('comparisons', dataset.version, signature),
+                    lambda: core.calculate_comparisons(dataset, selection, monthly))
+    if config.PROGRESSIVE:
+        core.stratified_sample(dataset)
+
+
+def warm_up(load, result_cache=None, modules=HEAVY_MODULES, track_memory=False):
+    """
+    Executa o aquecimento e devolve (dataset, profiler). `load()` devolve o
+    Dataset; o profiler traz o tempo de importações, carga e visão padrão.
+    """
+    previous = active_profiler()
+    profiler = Profiler('aquecimento', track_memory=track_memory)
+    activate(profiler)
+    try:
+        with span('importacoes'):
+            import_modules(modules)
+        with span('carga') as s:
+            dataset = load()
+            s.rows = len(dataset.frame)
+        with span('visao_padrao'):
+            warm_default_view(dataset, result_cache)
+    finally:
+        profiler.finish()
+        activate(previous)
+    logger.info("Aquecimento em %.0f ms: %s", profiler.duration_ms, ', '.join(
+        f"{record['etapa']} {record['duracao_ms']:.0f} ms" for record in profiler.records if record['nivel'] == 0
+    ))
+    return dataset, profiler
+
+
+def format_breakdown(profiler):
+    """Detalhamento em texto, com as etapas indentadas pelo nível."""
+    lines = []
+    for record in sorted(profiler.records, key=lambda r: r['inicio_ms']):
+        name = '  ' * record['nivel'] + record['etapa']
+        lines.append(f"{name:<40} {record['duracao_ms']:>10.1f} ms")
+    lines.append(f"{'total':<40} {profiler.duration_ms:>10.1f} ms")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aquece o snapshot dos dados e mostra o tempo de cada etapa.")
+    parser.add_argument('--json', action='store_true', help="imprime os registros em JSON")
+    args = parser.parse_args(argv)
+
+    def load():
+        import topcity_core as core
+
+        # Grava o snapshot no cache em disco: a primeira carga do app só o mapeia
+        return core.load_dataset(store=core.default_store(), max_age=config.SNAPSHOT_MAX_AGE)
+
+    _, profiler = warm_up(load)
+    if args.json:
+        print(json.dumps(profiler.records, ensure_ascii=False))
+    else:
+        print(format_breakdown(profiler))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())